@@ -1,60 +1,62 @@
-import os
-from dotenv import load_dotenv
+"""
+JWT аутентификация: выдача и проверка access/refresh токенов.
+Секрет и сроки жизни токенов берутся из app.core.config.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
 from datetime import datetime, timedelta, timezone
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from pydantic import BaseModel
+import jwt
+from jwt import InvalidTokenError
 
-load_dotenv()
+from app.core.config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+)
+from app.schemas import TokenResponse
 
-# ✅ FIX B4: ОБЯЗАТЕЛЬНАЯ ПЕРЕМЕННАЯ ОКРУЖЕНИЯ ДЛЯ JWT СЕКРЕТА
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-if not JWT_SECRET_KEY:
-    raise RuntimeError("""
-❌ КРИТИЧНАЯ ОШИБКА: Переменная окружения JWT_SECRET_KEY не задана!
-Это критично для безопасности приложения.
-
-Установите её перед запуском:
-  export JWT_SECRET_KEY='your-secret-key-here-min-32-chars'
-
-Или в .env файле:
-  JWT_SECRET_KEY=your-secret-key-here-min-32-chars
-
-Сгенерировать безопасный ключ:
-  openssl rand -base64 32
-""")
-
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 15  # Короткоживущий: 15 минут
-REFRESH_TOKEN_EXPIRE_DAYS = 30     # Долгоживущий: 30 дней
+# Кэш проверенных access token'ов: не декодируем JWT на каждый запрос
+TOKEN_CACHE_MAX_ITEMS = 10_000
+TOKEN_CACHE_TTL = 60               # секунды, но не дольше exp токена
 
 security = HTTPBearer()
 
-
-# ============================================
-# Pydantic Models
-# ============================================
-
-class TokenResponse(BaseModel):
-    """Ответ при логине — оба токена."""
-    access_token: str
-    refresh_token: str
-    token_type: str = "bearer"
-    expires_in: int  # в секундах
-
-
-class AccessTokenResponse(BaseModel):
-    """Ответ при обновлении access_token'а."""
-    access_token: str
-    token_type: str = "bearer"
-    expires_in: int  # в секундах
+# token -> (user_id, валиден до (unix time))
+_token_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_token_cache_lock = Lock()
+
+
+def _get_cached_user_id(token: str) -> Optional[str]:
+    """Возвращает user_id для уже проверенного токена, если запись не истекла."""
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            return None
+        user_id, valid_until = entry
+        if time.time() >= valid_until:
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return user_id
 
 
-class RefreshTokenRequest(BaseModel):
-    """Request для /api/refresh endpoint'а."""
-    refresh_token: str
+def _cache_user_id(token: str, user_id: str, exp: Optional[float]) -> None:
+    """Запоминает проверенный токен на TOKEN_CACHE_TTL (но не дольше его exp)."""
+    valid_until = time.time() + TOKEN_CACHE_TTL
+    if exp is not None:
+        valid_until = min(valid_until, float(exp))
+    with _token_cache_lock:
+        _token_cache[token] = (user_id, valid_until)
+        _token_cache.move_to_end(token)
+        if len(_token_cache) > TOKEN_CACHE_MAX_ITEMS:
+            _token_cache.popitem(last=False)
 
 
 # ============================================
@@ -80,7 +82,7 @@ def create_access_token(user_id: str) -> str:
         "token_type": "access",
         "exp": expire
     }
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
 
@@ -103,7 +105,7 @@ def create_refresh_token(user_id: str) -> str:
         "token_type": "refresh",
         "exp": expire
     }
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
 
@@ -126,10 +128,33 @@ def create_token_pair(user_id: str) -> TokenResponse:
 # Token Verification Functions
 # ============================================
 
+def user_id_from_token(token: str) -> Optional[str]:
+    """
+    user_id из access token без HTTPException (None, если токен невалиден).
+    Используется rate limiter'ом для ключа "на пользователя".
+    """
+    cached_user_id = _get_cached_user_id(token)
+    if cached_user_id is not None:
+        return cached_user_id
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except InvalidTokenError:
+        return None
+    user_id = payload.get("user_id")
+    if user_id is None or payload.get("token_type", "access") != "access":
+        return None
+    # Тот же токен сразу проверит verify_token — пусть найдёт его в кэше
+    _cache_user_id(token, user_id, payload.get("exp"))
+    return user_id
+
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """
     Проверяет ACCESS TOKEN и возвращает user_id.
 
+    Успешно проверенные токены кэшируются на TOKEN_CACHE_TTL секунд
+    (не дольше их exp), повторные запросы не декодируют JWT.
+
     Args:
         credentials: HTTP Authorization credentials
 
@@ -140,8 +165,14 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         HTTPException: если токен неверный, истёкший или не access_token
     """
     token = credentials.credentials
+
+    # Токен уже проверяли недавно — подпись не пересчитываем
+    cached_user_id = _get_cached_user_id(token)
+    if cached_user_id is not None:
+        return cached_user_id
+
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
         user_id: str = payload.get("user_id")
         token_type: str = payload.get("token_type", "access")
         
@@ -157,8 +188,10 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Неверный токен",
             )
+
+        _cache_user_id(token, user_id, payload.get("exp"))
         return user_id
-    except JWTError:
+    except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный или истёкший токен",
@@ -180,7 +213,7 @@ def verify_refresh_token(refresh_token: str) -> str:
         HTTPException: если токен неверный, истёкший или не refresh_token
     """
     try:
-        payload = jwt.decode(refresh_token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(refresh_token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
         user_id: str = payload.get("user_id")
         token_type: str = payload.get("token_type", "refresh")
         
@@ -197,8 +230,20 @@ def verify_refresh_token(refresh_token: str) -> str:
                 detail="Неверный refresh_token",
             )
         return user_id
-    except JWTError:
+    except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный или истёкший refresh_token",
         )
+
+
+__all__ = [
+    "ACCESS_TOKEN_EXPIRE_MINUTES",
+    "REFRESH_TOKEN_EXPIRE_DAYS",
+    "create_access_token",
+    "create_refresh_token",
+    "create_token_pair",
+    "user_id_from_token",
+    "verify_token",
+    "verify_refresh_token",
+]
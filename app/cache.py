@@ -1,81 +1,420 @@
 """
 Управление кэшем для парсера и компрессора сообщений.
-Использует in-memory словари с потокобезопасностью (Lock).
+Использует in-memory LRU (OrderedDict), разбитые на шарды, у каждого шарда свой Lock.
+
+Два уровня кэша:
+- по (user_id, сообщение) — повтор запроса тем же пользователем;
+- по нормализованному тексту (без регистра и лишних пробелов) — тот же
+  вопрос от другого пользователя или в другом написании тоже не идёт
+  в GigaChat; одинаковое сжатие даёт одинаковый вход агентов, и их
+  ответы берутся из кэша ответов.
+
+Отдельно — кэш ответов агентов по (агент, blake2b(вход)) с TTL,
+кэш сжатых сообщений по Idempotency-Key для повторов запроса,
+кэш ответа Терапевта для повтора запроса с тем же Idempotency-Key
+и кэш Генератора гипотез по похожести сообщения пользователя.
 """
 
+import time
 import hashlib
-from typing import Optional, Dict
+import logging
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar
 from threading import Lock
-from app.schemas import ParsedRequest, CompressedMessage
+from app.schemas import ParsedRequest, CompressedMessage, TherapyResponse
 from app.core.logger import logger
-from app.core.config import CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE
+from app.core.config import (
+    CACHE_MAX_ITEMS,
+    CACHE_CLEANUP_SIZE,
+    CACHE_SHARDS,
+    RESPONSE_CACHE_MAX_ITEMS,
+    RESPONSE_CACHE_TTL,
+    IDEMPOTENCY_CACHE_TTL,
+    THERAPY_RETRY_CACHE_TTL,
+    HYPOTHESIS_CACHE_MAX_ITEMS,
+    HYPOTHESIS_CACHE_TTL,
+    HYPOTHESIS_CACHE_SIMILARITY,
+)
+
+# Ключ кэша: (user_id, сообщение)
+CacheKey = Tuple[str, str]
+
+# Ключ кэша ответов: (агент, blake2b от входа)
+ResponseKey = Tuple[str, str]
+
+# Запись кэша ответов: (истекает в, текст ответа, usage)
+ResponseEntry = Tuple[float, str, dict]
+
+# Запись кэша по Idempotency-Key: (истекает в, blake2b сообщения, сжатое сообщение)
+IdempotentEntry = Tuple[float, str, CompressedMessage]
+
+# Запись кэша повторов Терапевта: (истекает в, blake2b сообщения, ответ)
+TherapyRetryEntry = Tuple[float, str, TherapyResponse]
+
+# Запись кэша Генератора гипотез: (истекает в, нормализованное сообщение, ответ)
+HypothesisEntry = Tuple[float, str, str]
+
+V = TypeVar("V")
+
+
+class _ShardedLRU(Generic[V]):
+    """
+    LRU-кэш из CACHE_SHARDS независимых OrderedDict, у каждого свой Lock на запись.
+
+    Лимиты делятся на число шардов — суммарный объём остаётся
+    max_items / cleanup_size. Логирование — на вызывающей стороне,
+    вне критической секции.
+    """
+
+    def __init__(self, max_items: int, cleanup_size: int) -> None:
+        self._shard_max_items = max(1, max_items // CACHE_SHARDS)
+        self._shard_cleanup_size = max(1, cleanup_size // CACHE_SHARDS)
+        self._shards: List["OrderedDict[Hashable, V]"] = [OrderedDict() for _ in range(CACHE_SHARDS)]
+        self._locks: List[Lock] = [Lock() for _ in range(CACHE_SHARDS)]
+
+    @staticmethod
+    def _shard_index(key: Hashable) -> int:
+        """Номер шарда для ключа (CACHE_SHARDS — степень двойки)."""
+        return hash(key) & (CACHE_SHARDS - 1)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Возвращает значение и помечает его как недавно использованное.
+
+        Чтение идёт без Lock: в CPython OrderedDict реализован на C, и
+        get/move_to_end атомарны под GIL. Lock берут только put/clear.
+        Если запись вытеснили между get и move_to_end — просто
+        пропускаем обновление порядка. На free-threaded сборке (3.13t+)
+        сюда нужно вернуть Lock шарда.
+        """
+        shard = self._shards[self._shard_index(key)]
+        cached = shard.get(key)
+        if cached is not None:
+            try:
+                shard.move_to_end(key)
+            except KeyError:
+                pass
+        return cached
+
+    def put(self, key: Hashable, value: V) -> Optional[Tuple[int, int]]:
+        """
+        Кладёт значение в кэш.
+
+        Returns:
+            (номер шарда, осталось записей), если шард пришлось чистить, иначе None
+        """
+        idx = self._shard_index(key)
+        with self._locks[idx]:
+            shard = self._shards[idx]
+            shard[key] = value
+            shard.move_to_end(key)
+            if len(shard) <= self._shard_max_items:
+                return None
+            # Выкидываем самые старые записи до cleanup_size
+            while len(shard) > self._shard_cleanup_size:
+                shard.popitem(last=False)
+            return idx, len(shard)
+
+    def clear(self) -> None:
+        """Очищает все шарды."""
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                shard.clear()
+
 
 # Глобальные кэши
-_parsed_cache: Dict[str, ParsedRequest] = {}
-_compressed_cache: Dict[str, dict] = {}
-_cache_lock = Lock()
+_parsed_cache: "_ShardedLRU[ParsedRequest]" = _ShardedLRU(CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE)
+_compressed_cache: "_ShardedLRU[CompressedMessage]" = _ShardedLRU(CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE)
+
+# Кэши по нормализованному тексту сообщения (общие для всех пользователей)
+_parsed_by_content: "_ShardedLRU[ParsedRequest]" = _ShardedLRU(CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE)
+_compressed_by_content: "_ShardedLRU[CompressedMessage]" = _ShardedLRU(CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE)
+
+# Сжатые сообщения по (user_id, Idempotency-Key)
+_idempotent_compressed: "_ShardedLRU[IdempotentEntry]" = _ShardedLRU(CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE)
+
+# Ответ Терапевта по (user_id, Idempotency-Key)
+_therapy_retry: "_ShardedLRU[TherapyRetryEntry]" = _ShardedLRU(CACHE_MAX_ITEMS, CACHE_CLEANUP_SIZE)
+
+# Кэш ответов агентов GigaChat
+_response_cache: "_ShardedLRU[ResponseEntry]" = _ShardedLRU(
+    RESPONSE_CACHE_MAX_ITEMS, RESPONSE_CACHE_MAX_ITEMS // 2
+)
+
+# Ответы Генератора гипотез по (сессия, blake2b(id инсайтов и гипотез))
+_hypothesis_cache: "_ShardedLRU[HypothesisEntry]" = _ShardedLRU(
+    HYPOTHESIS_CACHE_MAX_ITEMS, HYPOTHESIS_CACHE_MAX_ITEMS // 2
+)
+_hypothesis_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+def get_cache_key(user_id: str, message: str) -> CacheKey:
+    """
+    Генерирует ключ кэша на основе user_id и сообщения.
 
+    Ключ — кортеж из самих строк: dict хэширует его встроенным hash()
+    (хэш строки кэшируется в объекте), без MD5 на каждый lookup.
+    """
+    return (user_id, message)
 
-def get_cache_key(user_id: str, message: str) -> str:
-    """Генерирует ключ кэша на основе user_id и сообщения."""
-    msg_hash = hashlib.md5(message.encode()).hexdigest()[:8]
-    return f"{user_id}:{msg_hash}"
+
+def _log_cleanup(name: str, cleaned: Optional[Tuple[int, int]]) -> None:
+    """Пишет в лог факт очистки шарда (если она была)."""
+    if cleaned is not None:
+        logger.info("%s cache cleaned | shard=%d | remaining=%d", name, *cleaned)
+
+
+def _normalize_message(message: str) -> str:
+    """
+    Сообщение без регистра и лишних пробелов.
+
+    Ключ кэшей по тексту и основа сравнения похожести: "Стоит ли  запускать?"
+    и "стоит ли запускать?" — один и тот же вопрос к совету.
+    """
+    return " ".join(message.lower().split())
 
 
 def get_cached_parse(user_id: str, message: str) -> Optional[ParsedRequest]:
-    """Получает кэшированный парс запроса."""
-    with _cache_lock:
-        key = get_cache_key(user_id, message)
-        cached = _parsed_cache.get(key)
-        if cached:
-            logger.info("Parser cache hit | user=%s | message=%s", user_id, message[:50])
-        return cached
+    """
+    Получает кэшированный парс запроса (сначала по пользователю, затем по тексту).
+
+    Кэш по тексту общий для всех пользователей и ключуется нормализованным
+    текстом, поэтому в записи может лежать чужое написание сообщения:
+    при попадании отдаём копию с original_message вызывающего.
+    """
+    cached = _parsed_cache.get(get_cache_key(user_id, message))
+    if cached is None:
+        cached = _parsed_by_content.get(_normalize_message(message))
+        if cached is not None and cached.original_message != message:
+            cached = cached.model_copy(update={"original_message": message})
+
+    if cached is not None and logger.isEnabledFor(logging.INFO):
+        logger.info("Parser cache hit | user=%s | message=%s", user_id, message[:50])
+    return cached
 
 
 def cache_parse(user_id: str, message: str, parsed: ParsedRequest) -> None:
-    """Кэширует парс запроса."""
-    with _cache_lock:
-        key = get_cache_key(user_id, message)
-        _parsed_cache[key] = parsed
-        if len(_parsed_cache) > CACHE_MAX_ITEMS:
-            keys_to_delete = list(_parsed_cache.keys())[:-CACHE_CLEANUP_SIZE]
-            for k in keys_to_delete:
-                del _parsed_cache[k]
-            logger.info("Parser cache cleaned | remaining=%d", len(_parsed_cache))
-
-
-def get_cached_compressed(user_id: str, message: str) -> Optional[dict]:
-    """Получает кэшированное сжатое сообщение."""
-    with _cache_lock:
-        key = get_cache_key(user_id, message)
-        return _compressed_cache.get(key)
-
-
-def cache_compressed(user_id: str, message: str, compressed: dict) -> None:
-    """Кэширует сжатое сообщение."""
-    with _cache_lock:
-        key = get_cache_key(user_id, message)
-        _compressed_cache[key] = compressed
-        if len(_compressed_cache) > CACHE_MAX_ITEMS:
-            keys_to_delete = list(_compressed_cache.keys())[:-CACHE_CLEANUP_SIZE]
-            for k in keys_to_delete:
-                del _compressed_cache[k]
-            logger.info("Compressed cache cleaned | remaining=%d", len(_compressed_cache))
+    """Кэширует парс запроса (по пользователю и по тексту)."""
+    _log_cleanup("Parser", _parsed_cache.put(get_cache_key(user_id, message), parsed))
+    _log_cleanup("Parser content", _parsed_by_content.put(_normalize_message(message), parsed))
+
+
+def get_cached_compressed(user_id: str, message: str) -> Optional[CompressedMessage]:
+    """Получает кэшированное сжатое сообщение (сначала по пользователю, затем по тексту)."""
+    cached = _compressed_cache.get(get_cache_key(user_id, message))
+    if cached is None:
+        cached = _compressed_by_content.get(_normalize_message(message))
+    return cached
+
+
+def cache_compressed(user_id: str, message: str, compressed: CompressedMessage) -> None:
+    """Кэширует сжатое сообщение (сам объект, без повторной валидации при чтении)."""
+    _log_cleanup("Compressed", _compressed_cache.put(get_cache_key(user_id, message), compressed))
+    _log_cleanup("Compressed content", _compressed_by_content.put(_normalize_message(message), compressed))
+
+
+def _message_digest(message: str) -> str:
+    """Короткий blake2b от текста сообщения."""
+    return hashlib.blake2b(message.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_idempotent_compressed(
+    user_id: str,
+    idempotency_key: str,
+    message: str,
+) -> Optional[CompressedMessage]:
+    """
+    Сжатое сообщение, сохранённое для этого Idempotency-Key.
+
+    Запись используется, только если не истекла и ключ пришёл с тем же
+    текстом сообщения — повтор ключа с другим текстом сжимается заново.
+    """
+    entry = _idempotent_compressed.get((user_id, idempotency_key))
+    if entry is None:
+        return None
+
+    expires_at, digest, compressed = entry
+    if time.monotonic() >= expires_at or digest != _message_digest(message):
+        return None
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Idempotency cache hit | user=%s", user_id)
+    return compressed
+
+
+def cache_idempotent_compressed(
+    user_id: str,
+    idempotency_key: str,
+    message: str,
+    compressed: CompressedMessage,
+) -> None:
+    """Запоминает сжатое сообщение для Idempotency-Key на IDEMPOTENCY_CACHE_TTL секунд."""
+    entry = (time.monotonic() + IDEMPOTENCY_CACHE_TTL, _message_digest(message), compressed)
+    _log_cleanup("Idempotency", _idempotent_compressed.put((user_id, idempotency_key), entry))
+
+
+def get_therapy_retry(
+    user_id: str,
+    idempotency_key: str,
+    message: str,
+) -> Optional[TherapyResponse]:
+    """
+    Прошлый ответ Терапевта для повтора запроса с тем же Idempotency-Key.
+
+    Повтор (сетевой сбой, ретрай клиента) в течение THERAPY_RETRY_CACHE_TTL
+    получает тот же ответ без вызовов GigaChat и записи в БД, в том числе
+    не создаёт вторую сессию. Ключ задаёт клиент: одинаковый текст без
+    ключа — это новый ответ пользователя ("да", "не знаю"), а не повтор.
+    """
+    entry = _therapy_retry.get((user_id, idempotency_key))
+    if entry is None:
+        return None
+
+    expires_at, digest, response = entry
+    if time.monotonic() >= expires_at or digest != _message_digest(message):
+        return None
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Therapy retry cache hit | user=%s | session_id=%s", user_id, response.session_id)
+    return response
+
+
+def cache_therapy_retry(
+    user_id: str,
+    idempotency_key: str,
+    message: str,
+    response: TherapyResponse,
+) -> None:
+    """Запоминает ответ Терапевта для Idempotency-Key на THERAPY_RETRY_CACHE_TTL секунд."""
+    entry = (time.monotonic() + THERAPY_RETRY_CACHE_TTL, _message_digest(message), response)
+    _log_cleanup("Therapy retry", _therapy_retry.put((user_id, idempotency_key), entry))
+
+
+def get_response_key(agent: str, input_text: str) -> ResponseKey:
+    """
+    Ключ кэша ответов: (агент, blake2b от входа).
+
+    Входы агентов — килобайты JSON и истории, поэтому в ключе храним
+    16-байтовый дайджест, а не сам текст.
+    """
+    return (agent, _message_digest(input_text))
+
+
+def get_cached_response(agent: str, input_text: str) -> Optional[Tuple[str, dict]]:
+    """Получает кэшированный ответ агента, если он ещё не истёк."""
+    entry = _response_cache.get(get_response_key(agent, input_text))
+    if entry is None:
+        return None
+
+    expires_at, text, usage = entry
+    if time.monotonic() >= expires_at:
+        return None
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Response cache hit | agent=%s", agent)
+    return text, dict(usage)
+
+
+def cache_response(agent: str, input_text: str, text: str, usage: dict) -> None:
+    """Кэширует ответ агента на RESPONSE_CACHE_TTL секунд."""
+    entry = (time.monotonic() + RESPONSE_CACHE_TTL, text, dict(usage))
+    _log_cleanup("Response", _response_cache.put(get_response_key(agent, input_text), entry))
+
+
+def _hypothesis_key(
+    session_id: str,
+    state_ids: Iterable[str],
+    context_tail: str,
+) -> Tuple[str, str]:
+    """
+    Ключ кэша Генератора: сессия + дайджест отсортированных id инсайтов
+    и гипотез вместе с хвостом контекста (гипотезы и последние сообщения).
+    """
+    state = "|".join(sorted(state_ids))
+    return (session_id, _message_digest(f"{state}\n{context_tail}"))
+
+
+def get_similar_hypotheses(
+    session_id: str,
+    state_ids: Iterable[str],
+    context_tail: str,
+    message: str,
+) -> Optional[str]:
+    """
+    Ответ Генератора гипотез для того же состояния сессии и похожего сообщения.
+
+    Состояние — набор id инсайтов и гипотез плюс хвост контекста (текущие
+    гипотезы и последние сообщения, включая вопрос Терапевта): пока он не
+    изменился, прошлый ответ Генератора применим без повторного вызова.
+    Без хвоста короткое «да» на разные вопросы Терапевта получало бы один
+    и тот же ответ. Сообщение пользователя сравнивается difflib с порогом
+    HYPOTHESIS_CACHE_SIMILARITY.
+    """
+    entry = _hypothesis_cache.get(_hypothesis_key(session_id, state_ids, context_tail))
+    if entry is not None:
+        expires_at, cached_message, response_text = entry
+        if time.monotonic() < expires_at:
+            matcher = SequenceMatcher(None, _normalize_message(message), cached_message)
+            if (
+                matcher.quick_ratio() >= HYPOTHESIS_CACHE_SIMILARITY
+                and matcher.ratio() >= HYPOTHESIS_CACHE_SIMILARITY
+            ):
+                _hypothesis_cache_stats["hits"] += 1
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Hypothesis cache hit | session_id=%s", session_id)
+                return response_text
+
+    _hypothesis_cache_stats["misses"] += 1
+    return None
+
+
+def cache_similar_hypotheses(
+    session_id: str,
+    state_ids: Iterable[str],
+    context_tail: str,
+    message: str,
+    response_text: str,
+) -> None:
+    """Запоминает ответ Генератора для состояния сессии на HYPOTHESIS_CACHE_TTL секунд."""
+    entry = (time.monotonic() + HYPOTHESIS_CACHE_TTL, _normalize_message(message), response_text)
+    key = _hypothesis_key(session_id, state_ids, context_tail)
+    _log_cleanup("Hypothesis", _hypothesis_cache.put(key, entry))
+
+
+def get_hypothesis_cache_stats() -> Dict[str, int]:
+    """Счётчики попаданий/промахов кэша Генератора гипотез."""
+    return dict(_hypothesis_cache_stats)
 
 
 def clear_all_caches() -> None:
     """Очищает все кэши (для тестирования и управления памятью)."""
-    with _cache_lock:
-        _parsed_cache.clear()
-        _compressed_cache.clear()
-        logger.info("All caches cleared")
+    _parsed_cache.clear()
+    _compressed_cache.clear()
+    _parsed_by_content.clear()
+    _compressed_by_content.clear()
+    _idempotent_compressed.clear()
+    _therapy_retry.clear()
+    _response_cache.clear()
+    _hypothesis_cache.clear()
+    logger.info("All caches cleared")
 
 
 __all__ = [
     "get_cache_key",
+    "get_response_key",
     "get_cached_parse",
     "cache_parse",
     "get_cached_compressed",
     "cache_compressed",
+    "get_idempotent_compressed",
+    "cache_idempotent_compressed",
+    "get_therapy_retry",
+    "cache_therapy_retry",
+    "get_cached_response",
+    "cache_response",
+    "get_similar_hypotheses",
+    "cache_similar_hypotheses",
+    "get_hypothesis_cache_stats",
     "clear_all_caches",
 ]
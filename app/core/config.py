@@ -23,6 +23,12 @@ GIGA_API_BASE = "https://gigachat.devices.sberbank.ru"
 GIGA_SCOPE = "GIGACHAT_API_PERS"
 GIGA_MODEL = "GigaChat-2"
 GIGA_REQUEST_TIMEOUT = 60  # секунды
+GIGA_MAX_CONNECTIONS = 100           # размер пула httpx
+GIGA_MAX_KEEPALIVE_CONNECTIONS = 20  # соединений, держим открытыми между запросами
+GIGA_TOKEN_TTL = 25 * 60             # секунды: токен живёт ~30 минут, обновляем с запасом (если нет expires_at)
+GIGA_TOKEN_REFRESH_MARGIN = 5 * 60   # секунды до expires_at, когда токен уже обновляем
+GIGA_HTTP2 = True                    # параллельные запросы совета мультиплексируются в одном TLS соединении
+GIGA_CONCURRENCY = int(os.getenv("GIGA_CONCURRENCY", "8"))  # одновременных chat запросов к GigaChat на процесс
 
 GIGA_AUTH_KEY = os.getenv("GIGACHAT_AUTH_KEY")
 if not GIGA_AUTH_KEY:
@@ -31,7 +37,7 @@ if not GIGA_AUTH_KEY:
         "Установите её перед запуском приложения."
     )
 
-# ===== JWT (из auth.py) =====
+# ===== JWT (app/auth.py) =====
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 if not JWT_SECRET_KEY:
     raise RuntimeError(
@@ -63,6 +69,25 @@ RATE_LIMIT_BOARD_CHAT = "10/minute"      # POST /api/board
 RATE_LIMIT_SINGLE_AGENT = "20/minute"    # POST /api/agent
 RATE_LIMIT_SUMMARY = "10/minute"         # POST /api/summary
 
+# Хранилище счётчиков: memory:// — на процесс, redis://host:6379/0 — общее для воркеров
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+RATE_LIMIT_STRATEGY = "moving-window"
+
+# ===== BOARD =====
+HISTORY_MAX_CHARS = 4000                 # бюджет истории во входе агента (~1000 токенов при 4 символах на токен)
+
+# ===== THERAPY =====
+HYPOTHESIS_SIMILARITY_THRESHOLD = 0.85   # difflib ratio, выше — гипотезы считаются дублями
+HYPOTHESIS_LOCAL_DEDUP_MAX = 3           # столько уникальных гипотез сохраняем без LLM дедупликатора
+
 # ===== CACHING =====
 CACHE_MAX_ITEMS = 1000           # максимум записей в кэше
 CACHE_CLEANUP_SIZE = 500         # оставлять при очистке
+CACHE_SHARDS = 16                # число шардов (степень двойки), у каждого свой Lock
+RESPONSE_CACHE_MAX_ITEMS = 1024  # ответов агентов в кэше
+RESPONSE_CACHE_TTL = 600         # секунды жизни ответа агента в кэше
+IDEMPOTENCY_CACHE_TTL = 600      # секунды: сжатое сообщение для повторов с тем же Idempotency-Key
+THERAPY_RETRY_CACHE_TTL = 120    # секунды: ответ Терапевта для повторов с тем же Idempotency-Key
+HYPOTHESIS_CACHE_MAX_ITEMS = 1024    # ответов Генератора гипотез (по одному на состояние сессии)
+HYPOTHESIS_CACHE_TTL = 3600          # секунды жизни ответа Генератора в кэше
+HYPOTHESIS_CACHE_SIMILARITY = 0.92   # difflib ratio сообщений пользователя для попадания в кэш
@@ -1,11 +1,16 @@
 """
 Конфигурация логирования для приложения.
 Предоставляет готовый logger для всех модулей.
+
+Запись в файл вынесена в фоновый поток (QueueHandler + QueueListener):
+потоки запросов только кладут запись в очередь и не ждут диск.
 """
 
 import os
+import atexit
+import queue
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from app.core.config import LOG_DIR, LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
 
 # Создаём директорию для логов, если не существует
@@ -15,19 +20,32 @@ os.makedirs(LOG_DIR, exist_ok=True)
 logger = logging.getLogger("gigachat")
 logger.setLevel(getattr(logging, LOG_LEVEL))
 
-# Обработчик с ротацией файлов
-handler = RotatingFileHandler(
-    LOG_FILE,
-    maxBytes=LOG_MAX_BYTES,
-    backupCount=LOG_BACKUP_COUNT,
-    encoding="utf-8",
-)
+# Обработчики — один раз на процесс: повторный импорт модуля (reload,
+# другой путь импорта) не должен вешать второй писатель на тот же файл.
+if not logger.handlers:
+    # Обработчик с ротацией файлов (работает в потоке QueueListener)
+    handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+
+    # Форматер. Висит только на файловом обработчике, поэтому asctime
+    # (time.strftime) считается в потоке QueueListener, а не в потоке запроса.
+    # QueueHandler на стороне запроса лишь подставляет args в message.
+    formatter = logging.Formatter(LOG_FORMAT)
+    handler.setFormatter(formatter)
+
+    # Очередь между потоками запросов и фоновым писателем
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
 
-# Форматер
-formatter = logging.Formatter(LOG_FORMAT)
-handler.setFormatter(formatter)
+    # Добавляем неблокирующий обработчик к логгеру
+    logger.addHandler(QueueHandler(log_queue))
 
-# Добавляем обработчик к логгеру
-logger.addHandler(handler)
+    # Фоновый поток, который форматирует и пишет записи в файл
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
 __all__ = ["logger"]
@@ -0,0 +1,39 @@
+"""
+Общий лимитер запросов для всех роутеров.
+
+Один экземпляр Limiter на приложение: счётчики лежат в общем хранилище
+(RATE_LIMIT_STORAGE_URI), поэтому лимит не умножается на число
+uvicorn-воркеров и не сбрасывается при рестарте (для redis://).
+"""
+
+from fastapi import Request
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+from app.core.config import RATE_LIMIT_STORAGE_URI, RATE_LIMIT_STRATEGY
+from app.auth import user_id_from_token
+
+
+def user_or_ip_key(request: Request) -> str:
+    """
+    Ключ лимита: user_id из access token, иначе IP клиента.
+
+    Квота считается на пользователя, а не на адрес — несколько
+    пользователей за одним NAT не делят один лимит.
+    """
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        user_id = user_id_from_token(token)
+        if user_id is not None:
+            return f"user:{user_id}"
+    return f"ip:{get_remote_address(request)}"
+
+
+limiter = Limiter(
+    key_func=user_or_ip_key,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY,
+)
+
+__all__ = ["limiter", "user_or_ip_key"]
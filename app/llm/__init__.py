@@ -4,6 +4,8 @@ LLM слой приложения.
 """
 
 from app.llm.client import (
+    start_http_client,
+    close_http_client,
     get_gigachat_token,
     ask_gigachat,
     expand_agent_output,
@@ -18,6 +20,8 @@ from app.llm.processor import (
 
 __all__ = [
     # client.py
+    "start_http_client",
+    "close_http_client",
     "get_gigachat_token",
     "ask_gigachat",
     "expand_agent_output",
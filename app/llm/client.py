@@ -7,12 +7,14 @@ GigaChat API клиент.
 import os
 import uuid
 import time
-import json
-import requests
-from datetime import datetime, timedelta, timezone
-from typing import Tuple, Optional
-from threading import Lock
-import urllib3
+import hashlib
+import logging
+import orjson
+import asyncio
+import httpx
+from datetime import datetime, timezone
+from typing import Dict, Tuple, Optional
+from functools import lru_cache
 
 from app.core.config import (
     GIGA_AUTH_URL,
@@ -21,29 +23,176 @@ from app.core.config import (
     GIGA_AUTH_KEY,
     GIGA_MODEL,
     GIGA_REQUEST_TIMEOUT,
+    GIGA_MAX_CONNECTIONS,
+    GIGA_MAX_KEEPALIVE_CONNECTIONS,
+    GIGA_HTTP2,
+    GIGA_CONCURRENCY,
+    GIGA_TOKEN_TTL,
+    GIGA_TOKEN_REFRESH_MARGIN,
 )
 from app.core.logger import logger
 from app.schemas import DebugMetadata
+from app.cache import get_response_key, get_cached_response, cache_response
 from app.services.prompts import AGENT_SYSTEM_PROMPTS, AGENT_PARAMS, EXPANDER_SYSTEM_PROMPT
 
-# Отключаем warnings для self-signed сертификатов
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# ===== HTTP КЛИЕНТ =====
+
+# Общий асинхронный клиент: держит пул keep-alive соединений к GigaChat
+# и не блокирует event loop FastAPI на время запроса.
+# Создаётся и закрывается в lifespan приложения (main.py).
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    """
+    Создаёт клиент с пулом соединений (verify=False — у Sber self-signed сертификат).
+
+    С HTTP/2 запросы агентов идут потоками одного соединения; если сервер
+    не согласует h2 через ALPN, httpx остаётся на HTTP/1.1 keep-alive.
+    """
+    return httpx.AsyncClient(
+        verify=False,
+        http2=GIGA_HTTP2,
+        timeout=GIGA_REQUEST_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=GIGA_MAX_CONNECTIONS,
+            max_keepalive_connections=GIGA_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """
+    Открывает общий HTTP клиент (вызывается при старте приложения).
+
+    Returns:
+        httpx.AsyncClient: тот же клиент, что используют запросы к GigaChat
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = _create_http_client()
+        logger.info(
+            "GigaChat HTTP client started | max_connections=%d | max_keepalive=%d | http2=%s",
+            GIGA_MAX_CONNECTIONS,
+            GIGA_MAX_KEEPALIVE_CONNECTIONS,
+            GIGA_HTTP2,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий HTTP клиент и его соединения (при остановке приложения)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("GigaChat HTTP client closed")
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий клиент; вне приложения (скрипты) создаёт его лениво."""
+    global _http_client
+    if _http_client is None:
+        _http_client = _create_http_client()
+    return _http_client
+
+
+async def _post_chat(headers: Dict[str, str], payload: bytes) -> httpx.Response:
+    """
+    POST в chat/completions под общим семафором процесса.
+
+    Совет, терапия и компрессор вместе держат не больше GIGA_CONCURRENCY
+    запросов к GigaChat: остальные ждут здесь, а не получают 429 от Sber.
+    """
+    async with _chat_semaphore:
+        return await _get_http_client().post(
+            _CHAT_URL,
+            headers=headers,
+            content=payload,
+        )
+
+
+def _response_fingerprint(resp: httpx.Response) -> str:
+    """
+    Отпечаток тела ответа (blake2b, 8 байт) для INFO лога.
+
+    По отпечатку одинаковые ответы видны в логе без записи килобайтов текста.
+    """
+    return hashlib.blake2b(resp.content, digest_size=8).hexdigest()
+
+
+def _log_response(
+    kind: str,
+    resp: httpx.Response,
+    latency_ms: float,
+    agent: Optional[str] = None,
+) -> None:
+    """
+    Строка ответа GigaChat: размер и отпечаток на INFO, само тело — на DEBUG.
+
+    Отпечаток считается, только если INFO включён; тело пишется после строки INFO.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        if agent is None:
+            logger.info(
+                "%s response <- %s | status=%s | bytes=%d | fp=%s | latency=%.0fms",
+                kind,
+                _CHAT_URL,
+                resp.status_code,
+                len(resp.content),
+                _response_fingerprint(resp),
+                latency_ms,
+            )
+        else:
+            logger.info(
+                "%s response <- %s | agent=%s | status=%s | bytes=%d | fp=%s | latency=%.0fms",
+                kind,
+                _CHAT_URL,
+                agent,
+                resp.status_code,
+                len(resp.content),
+                _response_fingerprint(resp),
+                latency_ms,
+            )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s response body | %s", kind, resp.text)
+
 
 # ===== ГЛОБАЛЬНОЕ СОСТОЯНИЕ ТОКЕНА =====
 
 _access_token: Optional[str] = None
-_access_exp: Optional[datetime] = None
-_token_lock = Lock()
+_access_exp: float = 0.0  # дедлайн по time.monotonic()
+_token_lock = asyncio.Lock()
+
+# Неизменяемая часть запроса токена; RqUID — уникальный на каждый запрос
+# (строка uuid4 с дефисами — формат, который ждёт OAuth Sber)
+_AUTH_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded",
+    "Accept": "application/json",
+    "Authorization": f"Basic {GIGA_AUTH_KEY}",
+}
+_AUTH_DATA = {"scope": GIGA_SCOPE}
+
+# ===== ЗАПРОСЫ В ПОЛЁТЕ =====
+
+# (агент, blake2b(вход)) -> задача запроса: одинаковые одновременные
+# запросы ждут один вызов GigaChat
+_inflight_requests: Dict[Tuple[str, str], "asyncio.Task[Tuple[str, dict]]"] = {}
+
+# Ограничение одновременных chat запросов со всего процесса
+_chat_semaphore = asyncio.Semaphore(GIGA_CONCURRENCY)
 
 
 # ===== ПОЛУЧЕНИЕ ТОКЕНА =====
 
-def get_gigachat_token() -> str:
+async def get_gigachat_token() -> str:
     """
     Получает или обновляет JWT токен доступа к GigaChat API.
     
-    Использует глобальное состояние с lock для потокобезопасности.
-    Кэширует токен и обновляет только если истёк.
+    Double-checked locking: живой токен возвращается без asyncio.Lock,
+    обновление идёт под локом, и параллельные запросы на холодном старте
+    делают один вызов OAuth. Токен считается истёкшим за
+    GIGA_TOKEN_REFRESH_MARGIN до expires_at — обновляем заранее.
     
     Returns:
         JWT токен для авторизации в GigaChat API
@@ -53,19 +202,19 @@ def get_gigachat_token() -> str:
     """
     global _access_token, _access_exp
 
-    with _token_lock:
-        # Если токен ещё валидный — возвращаем его
-        if _access_token and _access_exp and datetime.now(timezone.utc) < _access_exp:
+    # Быстрый путь: токен живой — лок не нужен
+    token = _access_token
+    if token and time.monotonic() < _access_exp:
+        return token
+
+    async with _token_lock:
+        # Пока ждали лок, токен мог обновить другой запрос
+        if _access_token and time.monotonic() < _access_exp:
             return _access_token
 
-        # Готовим заголовки для запроса
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Accept": "application/json",
-            "RqUID": str(uuid.uuid4()),
-            "Authorization": f"Basic {GIGA_AUTH_KEY}",
-        }
-        data = {"scope": GIGA_SCOPE}
+        # Заголовки запроса: неизменяемая часть + свой RqUID
+        headers = _AUTH_HEADERS.copy()
+        headers["RqUID"] = str(uuid.uuid4())
 
         logger.info(
             "Auth request -> %s | RqUID=%s",
@@ -74,12 +223,11 @@ def get_gigachat_token() -> str:
         )
 
         # Отправляем запрос на получение токена
-        resp = requests.post(
+        resp = await _get_http_client().post(
             GIGA_AUTH_URL,
             headers=headers,
-            data=data,
+            data=_AUTH_DATA,
             timeout=10,
-            verify=False,  # Sber использует self-signed сертификат
         )
 
         logger.info(
@@ -90,66 +238,146 @@ def get_gigachat_token() -> str:
 
         # Обработка ошибок
         if resp.status_code != 200:
-            logger.error("Auth failed | status=%s | body=%s", resp.status_code, resp.text)
+            logger.error("Auth failed | status=%s | body=%s", resp.status_code, resp.text[:500])
             resp.raise_for_status()
 
-        j = resp.json()
+        j = orjson.loads(resp.content)
         _access_token = j["access_token"]
         
-        # Токен действует ~30 минут, ставим expiry на 25 минут (с запасом)
-        _access_exp = datetime.now(timezone.utc) + timedelta(minutes=25)
+        # Монотонные часы не прыгают при коррекции системного времени (NTP, suspend)
+        lifetime = _token_lifetime(j.get("expires_at"))
+        _access_exp = time.monotonic() + lifetime
 
-        logger.info("Auth successful | expires_at=%s", _access_exp.isoformat())
+        logger.info("Auth successful | expires_in=%.0fs", lifetime)
 
     return _access_token
 
 
+def _token_lifetime(expires_at: Optional[int]) -> float:
+    """
+    Сколько секунд использовать токен.
+
+    GigaChat возвращает expires_at (unix time в миллисекундах) — держим
+    токен до него минус GIGA_TOKEN_REFRESH_MARGIN. Если поля нет или часы
+    расходятся с сервером так, что срок уже прошёл, — GIGA_TOKEN_TTL.
+    """
+    if expires_at:
+        lifetime = expires_at / 1000 - time.time() - GIGA_TOKEN_REFRESH_MARGIN
+        if lifetime > 0:
+            return lifetime
+    return GIGA_TOKEN_TTL
+
+
 # ===== ОСНОВНОЙ ЗАПРОС К GIGACHAT =====
 
-def ask_gigachat(
+async def ask_gigachat(
     agent: str,
     user_msg: str,
     track_usage: bool = False,
+    use_cache: bool = True,
+    cache_session: Optional[str] = None,
 ) -> Tuple[str, dict]:
     """
     Отправляет запрос к GigaChat API и получает ответ от агента.
     
+    Одинаковый вход того же агента в течение RESPONSE_CACHE_TTL
+    отдаётся из кэша без запроса к API, а одновременные одинаковые
+    запросы объединяются в один. При track_usage кэш и объединение
+    не используются — в отладке нужны реальные метрики.
+    
     Args:
         agent: имя агента (ceo, cfo, cpo, marketing, skeptic, summary)
         user_msg: сообщение пользователя (уже должно содержать сжатый контекст)
         track_usage: нужно ли логировать детали использования токенов
+        use_cache: можно ли брать/класть ответ в кэш
+        cache_session: идентификатор диалога (например, терапевтической сессии);
+            GigaChat кэширует общий префикс запросов с тем же X-Session-ID
         
     Returns:
         Tuple[str, dict]: (текст ответа, словарь с usage метриками)
         
     Raises:
         KeyError: если agent не в AGENT_SYSTEM_PROMPTS
-        requests.RequestException: если ошибка при запросе к API
+        httpx.HTTPError: если ошибка при запросе к API
     """
-    token = get_gigachat_token()
-    system_prompt = AGENT_SYSTEM_PROMPTS[agent]
+    if not use_cache or track_usage:
+        return await _request_agent(agent, user_msg, track_usage, cache_session)
+
+    cached = get_cached_response(agent, user_msg)
+    if cached is not None:
+        return cached
+
+    # Такой же запрос уже летит (параллельные пользователи совета) —
+    # ждём его результат вместо второго вызова GigaChat.
+    # Запрос — отдельная задача: отмена одного ожидающего не рвёт его для остальных.
+    key = get_response_key(agent, user_msg)
+    task = _inflight_requests.get(key)
+    if task is None:
+        task = asyncio.create_task(_request_and_cache(agent, user_msg, cache_session))
+        _inflight_requests[key] = task
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+    else:
+        logger.info("Joined in-flight request | agent=%s", agent)
+
+    response_text, usage_dict = await asyncio.shield(task)
+    return response_text, dict(usage_dict)
+
+
+async def _request_and_cache(
+    agent: str,
+    user_msg: str,
+    cache_session: Optional[str] = None,
+) -> Tuple[str, dict]:
+    """Запрос агента, результат которого кладётся в кэш ответов."""
+    response_text, usage_dict = await _request_agent(agent, user_msg, False, cache_session)
+    cache_response(agent, user_msg, response_text, usage_dict)
+    return response_text, usage_dict
+
+
+def _forget_inflight(key: Tuple[str, str], task: "asyncio.Task[Tuple[str, dict]]") -> None:
+    """Убирает завершённый запрос из _inflight_requests."""
+    _inflight_requests.pop(key, None)
+    # Забираем исключение, даже если все ожидающие уже отменены
+    if not task.cancelled():
+        task.exception()
+
+
+def _cache_session_id(agent: str, cache_session: str) -> str:
+    """
+    X-Session-ID для кэша префикса GigaChat.
+
+    У агентов разные системные промпты, поэтому у каждого агента в диалоге
+    свой идентификатор — иначе запросы разных агентов вытесняли бы кэш друг друга.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{cache_session}:{agent}"))
+
+
+async def _request_agent(
+    agent: str,
+    user_msg: str,
+    track_usage: bool,
+    cache_session: Optional[str] = None,
+) -> Tuple[str, dict]:
+    """Сам HTTP запрос агента к GigaChat (без кэша и дедупликации)."""
+    token = await get_gigachat_token()
     params = AGENT_PARAMS[agent]
 
-    # Готовим payload для API
-    payload = {
-        "model": GIGA_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_msg},
-        ],
-        "stream": False,
-        "temperature": params["temperature"],
-        "max_tokens": params["max_tokens"],
-        "top_p": params["top_p"],
-    }
+    # Готовим тело запроса из заранее сериализованного шаблона агента
+    payload = _build_payload(
+        _payload_template(
+            AGENT_SYSTEM_PROMPTS[agent],
+            params["temperature"],
+            params["max_tokens"],
+            params["top_p"],
+        ),
+        user_msg,
+    )
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
+    headers = _chat_headers(token)
+    if cache_session:
+        headers["X-Session-ID"] = _cache_session_id(agent, cache_session)
 
-    url = f"{GIGA_API_BASE}/api/v1/chat/completions"
+    url = _CHAT_URL
 
     start_time = time.time()
 
@@ -162,23 +390,11 @@ def ask_gigachat(
     )
 
     # Отправляем запрос
-    resp = requests.post(
-        url,
-        headers=headers,
-        json=payload,
-        timeout=GIGA_REQUEST_TIMEOUT,
-        verify=False,
-    )
+    resp = await _post_chat(headers, payload)
 
     latency_ms = (time.time() - start_time) * 1000
 
-    logger.info(
-        "Chat response <- %s | agent=%s | status=%s | latency=%.0fms",
-        url,
-        agent,
-        resp.status_code,
-        latency_ms,
-    )
+    _log_response("Chat", resp, latency_ms, agent=agent)
 
     # Обработка ошибок
     if resp.status_code != 200:
@@ -190,7 +406,7 @@ def ask_gigachat(
         )
         resp.raise_for_status()
 
-    j = resp.json()
+    j = orjson.loads(resp.content)
 
     # Извлекаем данные из ответа
     finish_reason = j.get("choices", [{}])[0].get("finish_reason", "unknown")
@@ -221,7 +437,7 @@ def ask_gigachat(
 
 # ===== РАЗВОРАЧИВАНИЕ СЖАТОГО ОТВЕТА =====
 
-def expand_agent_output(
+async def expand_agent_output(
     agent: str,
     compressed_output: dict,
     track_usage: bool = False,
@@ -241,49 +457,30 @@ def expand_agent_output(
         Tuple[str, dict]: (расширенный текст, usage словарь)
         
     Raises:
-        requests.RequestException: если ошибка при запросе к API
+        httpx.HTTPError: если ошибка при запросе к API
     """
-    token = get_gigachat_token()
-
-    # Словарь с описанием ролей для контекста
-    AGENT_ROLES = {
-        "ceo": "CEO (стратегический лидер компании)",
-        "cfo": "CFO (финансовый директор)",
-        "cpo": "CPO (директор по продукту)",
-        "marketing": "VP Marketing (вице-президент маркетинга)",
-        "skeptic": "Skeptic (критический аналитик)",
-        "summary": "Summary (модератор совета)",
-    }
-
-    agent_role = AGENT_ROLES.get(agent, agent.upper())
-
-    # Готовим payload
-    payload = {
-        "model": GIGA_MODEL,
-        "messages": [
-            {"role": "system", "content": EXPANDER_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": (
-                    f"Роль агента: {agent_role}\n\n"
-                    f"Вот сжатый ответ (JSON), разверни в читаемый текст:\n\n"
-                    f"{json.dumps(compressed_output, ensure_ascii=False, indent=2)}"
-                ),
-            },
-        ],
-        "stream": False,
-        "temperature": AGENT_PARAMS["expander"]["temperature"],
-        "max_tokens": AGENT_PARAMS["expander"]["max_tokens"],
-        "top_p": AGENT_PARAMS["expander"]["top_p"],
-    }
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
+    token = await get_gigachat_token()
+
+    agent_role = _AGENT_ROLES.get(agent, agent.upper())
+    params = AGENT_PARAMS["expander"]
+
+    # Готовим тело запроса из заранее сериализованного шаблона expander
+    payload = _build_payload(
+        _payload_template(
+            EXPANDER_SYSTEM_PROMPT,
+            params["temperature"],
+            params["max_tokens"],
+            params["top_p"],
+        ),
+        (
+            f"Роль агента: {agent_role}\n\n"
+            f"Вот сжатый ответ (JSON), разверни в читаемый текст:\n\n"
+            f"{orjson.dumps(compressed_output).decode()}"
+        ),
+    )
 
-    url = f"{GIGA_API_BASE}/api/v1/chat/completions"
+    headers = _chat_headers(token)
+    url = _CHAT_URL
 
     start_time = time.time()
 
@@ -294,22 +491,11 @@ def expand_agent_output(
     )
 
     # Отправляем запрос
-    resp = requests.post(
-        url,
-        headers=headers,
-        json=payload,
-        timeout=GIGA_REQUEST_TIMEOUT,
-        verify=False,
-    )
+    resp = await _post_chat(headers, payload)
 
     latency_ms = (time.time() - start_time) * 1000
 
-    logger.info(
-        "Expander response <- %s | agent=%s | latency=%.0fms",
-        url,
-        agent,
-        latency_ms,
-    )
+    _log_response("Expander", resp, latency_ms, agent=agent)
 
     # Обработка ошибок
     if resp.status_code != 200:
@@ -321,7 +507,7 @@ def expand_agent_output(
         )
         resp.raise_for_status()
 
-    j = resp.json()
+    j = orjson.loads(resp.content)
     expanded_text = j["choices"][0]["message"]["content"].strip()
 
     # Извлекаем usage
@@ -366,6 +552,70 @@ def _extract_usage(response_json: dict) -> Tuple[int, int, int]:
     )
 
 
+# ===== ШАБЛОНЫ ЗАПРОСОВ =====
+
+_CHAT_URL = f"{GIGA_API_BASE}/api/v1/chat/completions"
+
+# Неизменяемая часть заголовков chat-запроса, на запрос подставляется только токен
+_CHAT_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+}
+
+# Описание ролей для контекста expander промпта
+_AGENT_ROLES = {
+    "ceo": "CEO (стратегический лидер компании)",
+    "cfo": "CFO (финансовый директор)",
+    "cpo": "CPO (директор по продукту)",
+    "marketing": "VP Marketing (вице-президент маркетинга)",
+    "skeptic": "Skeptic (критический аналитик)",
+    "summary": "Summary (модератор совета)",
+}
+
+
+def _chat_headers(token: str) -> Dict[str, str]:
+    """Заголовки chat-запроса: копия _CHAT_HEADERS с Authorization."""
+    headers = _CHAT_HEADERS.copy()
+    headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+@lru_cache(maxsize=32)
+def _payload_template(
+    system_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    top_p: float,
+) -> bytes:
+    """
+    Сериализует неизменяемую часть payload для system-промпта один раз.
+
+    Агенты, expander, парсер и компрессор вызываются с одними и теми же
+    промптами и параметрами, поэтому килобайты system-промпта кодируются
+    в JSON один раз, а не на каждый запрос. "messages" — последний ключ:
+    шаблон заканчивается на `]}`, и _build_payload дописывает сообщение
+    пользователя в этот массив.
+    """
+    return orjson.dumps({
+        "model": GIGA_MODEL,
+        "stream": False,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "top_p": top_p,
+        "messages": [{"role": "system", "content": system_prompt}],
+    })
+
+
+def _build_payload(template: bytes, user_msg: str) -> bytes:
+    """Тело запроса: шаблон с сообщением пользователя в конце массива messages."""
+    return b"".join((
+        template[:-2],
+        b",",
+        orjson.dumps({"role": "user", "content": user_msg}),
+        b"]}",
+    ))
+
+
 def create_debug_metadata(
     agent: str,
     compressed_input: Optional[dict] = None,
@@ -409,7 +659,7 @@ def create_debug_metadata(
 
 # ===== УНИВЕРСАЛЬНЫЙ ЗАПРОС К GIGACHAT =====
 
-def ask_gigachat_generic(
+async def ask_gigachat_generic(
     system_prompt: str,
     user_msg: str,
     temperature: float = 0.5,
@@ -437,30 +687,18 @@ def ask_gigachat_generic(
         Tuple[str, dict]: (текст ответа, словарь с usage метриками)
         
     Raises:
-        requests.RequestException: если ошибка при запросе к API
+        httpx.HTTPError: если ошибка при запросе к API
     """
-    token = get_gigachat_token()
+    token = await get_gigachat_token()
 
-    # Готовим payload
-    payload = {
-        "model": GIGA_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_msg},
-        ],
-        "stream": False,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-        "top_p": top_p,
-    }
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
+    # Готовим тело запроса из заранее сериализованного шаблона
+    payload = _build_payload(
+        _payload_template(system_prompt, temperature, max_tokens, top_p),
+        user_msg,
+    )
 
-    url = f"{GIGA_API_BASE}/api/v1/chat/completions"
+    headers = _chat_headers(token)
+    url = _CHAT_URL
 
     start_time = time.time()
 
@@ -472,22 +710,11 @@ def ask_gigachat_generic(
     )
 
     # Отправляем запрос
-    resp = requests.post(
-        url,
-        headers=headers,
-        json=payload,
-        timeout=GIGA_REQUEST_TIMEOUT,
-        verify=False,
-    )
+    resp = await _post_chat(headers, payload)
 
     latency_ms = (time.time() - start_time) * 1000
 
-    logger.info(
-        "Generic response <- %s | status=%s | latency=%.0fms",
-        url,
-        resp.status_code,
-        latency_ms,
-    )
+    _log_response("Generic", resp, latency_ms)
 
     # Обработка ошибок
     if resp.status_code != 200:
@@ -498,7 +725,7 @@ def ask_gigachat_generic(
         )
         resp.raise_for_status()
 
-    j = resp.json()
+    j = orjson.loads(resp.content)
 
     # Извлекаем данные из ответа
     response_text = j["choices"][0]["message"]["content"].strip()
@@ -527,6 +754,8 @@ def ask_gigachat_generic(
 
 
 __all__ = [
+    "start_http_client",
+    "close_http_client",
     "get_gigachat_token",
     "ask_gigachat",
     "expand_agent_output",
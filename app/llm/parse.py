@@ -0,0 +1,107 @@
+"""
+Разбор JSON-ответов агентов GigaChat.
+Одна реализация вместо копий try/except в каждом роуте.
+"""
+
+from typing import Optional, Tuple
+import orjson
+
+from app.core.logger import logger
+
+# Поля, без которых сжатый ответ агента совета неполон
+VERDICT_FIELDS: Tuple[str, ...] = ("verdict", "confidence")
+
+
+def _strip_code_fence(raw: str) -> Optional[str]:
+    """
+    Содержимое markdown-блока ```json ... ``` (модели иногда так оборачивают ответ).
+
+    Returns:
+        текст внутри блока, либо None если ответ не обёрнут в блок
+    """
+    text = raw.strip()
+    if not text.startswith("```") or not text.endswith("```") or len(text) < 6:
+        return None
+    # Первая строка — открывающий ``` с необязательным языком (```json)
+    newline = text.find("\n")
+    if newline == -1:
+        return None
+    return text[newline + 1:-3]
+
+
+def parse_json_object(raw: str) -> Optional[dict]:
+    """
+    Разбирает ответ модели как JSON-объект.
+
+    Ответ в markdown-блоке ```json ... ``` тоже разбирается: блок
+    снимается только если JSON не прочитался как есть.
+
+    Returns:
+        dict, либо None если это не JSON или не объект
+    """
+    try:
+        parsed = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        fenced = _strip_code_fence(raw)
+        if fenced is None:
+            return None
+        try:
+            parsed = orjson.loads(fenced)
+        except orjson.JSONDecodeError:
+            return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def parse_agent_json(
+    raw: str,
+    agent: str,
+    required: Tuple[str, ...] = VERDICT_FIELDS,
+    keep_raw_if_incomplete: bool = False,
+) -> Tuple[dict, bool]:
+    """
+    Разбирает сжатый JSON-ответ агента и проверяет обязательные поля.
+
+    Не-JSON превращается в {"verdict": "NO-DATA", ...}, JSON без
+    обязательных полей — в {"verdict": "INCOMPLETE", ...} с исходными ключами.
+
+    Args:
+        raw: текст ответа модели
+        agent: имя агента (для логов)
+        required: обязательные ключи
+        keep_raw_if_incomplete: добавить исходный текст в неполный ответ
+
+    Returns:
+        Tuple[dict, bool]: (сжатый ответ, прошёл ли он проверку)
+    """
+    parsed = parse_json_object(raw)
+
+    if parsed is None:
+        logger.warning("Agent %s returned non-JSON response: %s", agent, raw[:100])
+        return {
+            "verdict": "NO-DATA",
+            "confidence": 0,
+            "raw_response": raw[:500],
+        }, False
+
+    missing = [key for key in required if key not in parsed]
+    if missing:
+        logger.warning(
+            "Agent %s returned JSON but missing critical fields | missing=%s | keys=%s",
+            agent,
+            missing,
+            list(parsed.keys()),
+        )
+        incomplete = {"verdict": "INCOMPLETE", "confidence": 0}
+        if keep_raw_if_incomplete:
+            incomplete["raw_response"] = raw
+        incomplete.update(parsed)
+        return incomplete, False
+
+    return parsed, True
+
+
+__all__ = [
+    "VERDICT_FIELDS",
+    "parse_json_object",
+    "parse_agent_json",
+]
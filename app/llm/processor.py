@@ -4,10 +4,11 @@
 Не зависит от GigaChat — чистая трансформация данных.
 """
 
-import json
+import logging
 from typing import List, Optional
 
 from app.llm.client import ask_gigachat_generic
+from app.llm.parse import parse_json_object
 from app.cache import (
     get_cached_parse,
     cache_parse,
@@ -15,13 +16,38 @@ from app.cache import (
     cache_compressed,
 )
 from app.core.logger import logger
+from app.core.config import HISTORY_MAX_CHARS
 from app.schemas import ParsedRequest, CompressedMessage
 from app.services.prompts import PARSER_SYSTEM_PROMPT, COMPRESSOR_SYSTEM_PROMPT, AGENT_PARAMS
 
 
+# ===== FALLBACK-ШАБЛОНЫ =====
+# Используются, если LLM вернул невалидный JSON. Копируются через .copy(),
+# пустые списки — кортежи, чтобы копии не делили изменяемые объекты.
+
+_PARSER_FALLBACK = {
+    "intent": "other",
+    "domain": "strategy",
+    "key_points": (),
+    "assumptions": (),
+    "constraints": (),
+    "summary": None,
+}
+
+_COMPRESSOR_FALLBACK = {
+    "intent": "other",
+    "domain": "strategy",
+    "idea_summary": None,
+    "key_points": (),
+    "constraints": None,
+    "assumptions": (),
+    "key_facts": (),
+}
+
+
 # ===== ПАРСИНГ ИСХОДНОГО ЗАПРОСА =====
 
-def parse_user_request(user_msg: str, user_id: str = "anonymous") -> ParsedRequest:
+async def parse_user_request(user_msg: str, user_id: str = "anonymous") -> ParsedRequest:
     """
     Парсит исходный запрос пользователя в структурированную форму.
     
@@ -42,22 +68,30 @@ def parse_user_request(user_msg: str, user_id: str = "anonymous") -> ParsedReque
         ParsedRequest: структурированный парс запроса
         
     Raises:
-        requests.RequestException: если ошибка при запросе к GigaChat
+        httpx.HTTPError: если ошибка при запросе к GigaChat
     """
+    # Короткая выдержка сообщения для логов (срез один на весь вызов)
+    msg_head = user_msg[:50]
+
     # Проверяем кэш
     cached = get_cached_parse(user_id, user_msg)
     if cached:
-        logger.info("Parser cache hit | user=%s | message=%s", user_id, user_msg[:50])
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Parser cache hit | user=%s | message=%s", user_id, msg_head)
         return cached
 
-    logger.info(
-        "Parser: processing new request | user=%s | message=%s",
-        user_id,
-        user_msg[:50],
-    )
+    # Превью для fallback-ответа (нужно только без кэша)
+    msg_preview = user_msg[:200]
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Parser: processing new request | user=%s | message=%s",
+            user_id,
+            msg_head,
+        )
 
     # Парсим через GigaChat используя универсальную функцию
-    parser_output, usage = ask_gigachat_generic(
+    parser_output, usage = await ask_gigachat_generic(
         system_prompt=PARSER_SYSTEM_PROMPT,
         user_msg=user_msg,
         temperature=0.3,
@@ -66,27 +100,22 @@ def parse_user_request(user_msg: str, user_id: str = "anonymous") -> ParsedReque
         track_usage=False,
     )
 
-    logger.info(
-        "Parser output | message=%s | output=%s | tokens=%d",
-        user_msg[:50],
-        parser_output[:200],
-        usage.get("tokens_total", 0),
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Parser output | message=%s | output=%s | tokens=%d",
+            msg_head,
+            parser_output[:200],
+            usage.get("tokens_total", 0),
+        )
 
     # Парсим JSON из ответа
-    try:
-        parsed_json = json.loads(parser_output)
-    except json.JSONDecodeError:
-        logger.warning("Parser output is not valid JSON: %s", parser_output)
+    parsed_json = parse_json_object(parser_output)
+    if parsed_json is None:
+        logger.warning("Parser output is not a JSON object: %s", parser_output[:500])
         # Fallback если парсер сломался
-        parsed_json = {
-            "intent": "other",
-            "domain": "strategy",
-            "key_points": [user_msg[:200]],
-            "assumptions": [],
-            "constraints": [],
-            "summary": user_msg[:200],
-        }
+        parsed_json = _PARSER_FALLBACK.copy()
+        parsed_json["key_points"] = [msg_preview]
+        parsed_json["summary"] = msg_preview
 
     # Создаём ParsedRequest
     parsed = ParsedRequest(
@@ -107,7 +136,7 @@ def parse_user_request(user_msg: str, user_id: str = "anonymous") -> ParsedReque
 
 # ===== СЖАТИЕ СООБЩЕНИЯ ПОЛЬЗОВАТЕЛЯ =====
 
-def compress_user_message(user_msg: str, user_id: str = "anonymous") -> CompressedMessage:
+async def compress_user_message(user_msg: str, user_id: str = "anonymous") -> CompressedMessage:
     """
     Сжимает сообщение пользователя в структурированную выжимку (JSON).
     
@@ -129,26 +158,34 @@ def compress_user_message(user_msg: str, user_id: str = "anonymous") -> Compress
         CompressedMessage: структурированное и сжатое сообщение
         
     Raises:
-        requests.RequestException: если ошибка при запросе к GigaChat
+        httpx.HTTPError: если ошибка при запросе к GigaChat
     """
+    # Короткая выдержка сообщения для логов (срез один на весь вызов)
+    msg_head = user_msg[:50]
+
     # Проверяем кэш
     cached = get_cached_compressed(user_id, user_msg)
     if cached:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Compressed message cache hit | user=%s | message=%s",
+                user_id,
+                msg_head,
+            )
+        return cached
+
+    # Превью для fallback-ответа (нужно только без кэша)
+    msg_preview = user_msg[:200]
+
+    if logger.isEnabledFor(logging.INFO):
         logger.info(
-            "Compressed message cache hit | user=%s | message=%s",
+            "Compressor: processing new message | user=%s | message=%s",
             user_id,
-            user_msg[:50],
+            msg_head,
         )
-        return CompressedMessage(**cached)
-
-    logger.info(
-        "Compressor: processing new message | user=%s | message=%s",
-        user_id,
-        user_msg[:50],
-    )
 
     # Сжимаем через GigaChat используя универсальную функцию
-    compressor_output, usage = ask_gigachat_generic(
+    compressor_output, usage = await ask_gigachat_generic(
         system_prompt=COMPRESSOR_SYSTEM_PROMPT,
         user_msg=user_msg,
         temperature=AGENT_PARAMS["compressor"]["temperature"],
@@ -157,63 +194,62 @@ def compress_user_message(user_msg: str, user_id: str = "anonymous") -> Compress
         track_usage=False,
     )
 
-    logger.info(
-        "Compressor output | message=%s | output=%s | tokens=%d",
-        user_msg[:50],
-        compressor_output[:200],
-        usage.get("tokens_total", 0),
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Compressor output | message=%s | output=%s | tokens=%d",
+            msg_head,
+            compressor_output[:200],
+            usage.get("tokens_total", 0),
+        )
 
     # Парсим JSON из ответа
-    try:
-        compressed_json = json.loads(compressor_output)
-
-        # Валидируем наличие ключевых полей
-        if not compressed_json or not compressed_json.get("intent") or not compressed_json.get("domain"):
-            logger.warning("Compressor returned incomplete JSON: %s", compressed_json)
-            compressed_json = {
-                "intent": "other",
-                "domain": "strategy",
-                "idea_summary": user_msg[:100],
-                "key_points": [user_msg[:200]],
-                "constraints": None,
-                "assumptions": [],
-                "key_facts": []
-            }
-    except json.JSONDecodeError:
-        logger.warning("Compressor output is not valid JSON: %s", compressor_output)
+    compressed_json = parse_json_object(compressor_output)
+    if compressed_json is None:
+        logger.warning("Compressor output is not a JSON object: %s", compressor_output[:500])
         # Fallback
-        compressed_json = {
-            "intent": "other",
-            "domain": "strategy",
-            "idea_summary": user_msg[:100],
-            "key_points": [user_msg[:200]],
-            "constraints": None,
-            "assumptions": [],
-            "key_facts": []
-        }
+        compressed_json = _compressor_fallback(user_msg, msg_preview)
+    elif not compressed_json.get("intent") or not compressed_json.get("domain"):
+        # Валидируем наличие ключевых полей
+        logger.warning("Compressor returned incomplete JSON: %s", compressor_output[:500])
+        compressed_json = _compressor_fallback(user_msg, msg_preview)
 
     # Создаём CompressedMessage
     compressed = CompressedMessage(**compressed_json)
 
     # Кэшируем результат
-    cache_compressed(user_id, user_msg, compressed.dict())
+    cache_compressed(user_id, user_msg, compressed)
 
     return compressed
 
 
+def _compressor_fallback(user_msg: str, msg_preview: str) -> dict:
+    """Fallback-выжимка из шаблона, если компрессор вернул мусор."""
+    compressed_json = _COMPRESSOR_FALLBACK.copy()
+    compressed_json["idea_summary"] = user_msg[:100]
+    compressed_json["key_points"] = [msg_preview]
+    return compressed_json
+
+
 # ===== СЖАТИЕ ИСТОРИИ =====
 
-def compress_history(history: Optional[List[str]], max_items: int = 15) -> str:
+def compress_history(
+    history: Optional[List[str]],
+    max_items: int = 15,
+    max_chars: int = HISTORY_MAX_CHARS,
+) -> str:
     """
     Сжимает историю диалога до последних N сообщений.
     
     Используется для экономии токенов при включении истории в контекст агента.
-    Берёт только последние max_items сообщений и объединяет их в строку.
+    Берёт последние max_items сообщений, но не больше max_chars символов:
+    старые сообщения отбрасываются первыми, самое свежее остаётся всегда.
+    История уходит во вход каждого агента, поэтому длинное сообщение
+    иначе оплачивалось бы токенами многократно.
     
     Args:
         history: список сообщений (может быть None или пусто)
         max_items: максимум сообщений для сохранения
+        max_chars: бюджет символов на всю историю (~4 символа на токен)
         
     Returns:
         str: сжатая история (multi-line string) или пустая строка
@@ -221,18 +257,28 @@ def compress_history(history: Optional[List[str]], max_items: int = 15) -> str:
     if not history:
         return ""
     
-    # Берём только последние max_items
-    recent = history[-max_items:]
+    # Идём от свежих к старым, пока укладываемся в бюджет (+1 — перенос строки)
+    kept = 0
+    used = 0
+    for message in reversed(history):
+        if kept == max_items or (kept and used + len(message) + 1 > max_chars):
+            break
+        kept += 1
+        used += len(message) + 1
+    
+    # Короткую историю не копируем
+    recent = history if kept == len(history) else history[-kept:]
     
     # Объединяем в строку с переносами
     compressed = "\n".join(recent)
     
-    logger.debug(
-        "History compressed | original_len=%d | kept=%d | output_len=%d",
-        len(history),
-        len(recent),
-        len(compressed),
-    )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "History compressed | original_len=%d | kept=%d | output_len=%d",
+            len(history),
+            len(recent),
+            len(compressed),
+        )
     
     return compressed
 
@@ -4,11 +4,11 @@
 """
 
 from typing import List
+import orjson
 from fastapi import APIRouter, Request, Depends
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 
 from app.core.logger import logger
+from app.core.rate_limit import limiter
 from app.core.config import RATE_LIMIT_SINGLE_AGENT, RATE_LIMIT_SUMMARY
 from app.schemas import (
     SingleAgentRequest,
@@ -22,11 +22,9 @@ from app.llm import (
     compress_history,
     create_debug_metadata,
 )
+from app.llm.parse import parse_agent_json
 from app.services.prompts import AGENT_SYSTEM_PROMPTS
-from auth import verify_token
-
-# Лимитер для rate limiting
-limiter = Limiter(key_func=get_remote_address)
+from app.auth import verify_token
 
 # Создаём router для группировки agent endpoints
 router = APIRouter(prefix="/api", tags=["agent"])
@@ -67,17 +65,16 @@ async def single_agent(
 
     if req.message:
         # Сжимаем сообщение пользователя
-        compressed_msg = compress_user_message(req.message, user_id=user_id)
+        compressed_msg = await compress_user_message(req.message, user_id=user_id)
         logger.info(
             "Compressed single message | intent=%s | domain=%s",
             compressed_msg.intent,
             compressed_msg.domain,
         )
 
-        parts.extend([
-            "СЖАТЫЙ ЗАПРОС (JSON):",
-            str(compressed_msg.dict()),  # ← Должно быть JSON, но для простоты str()
-        ])
+        parts.append(
+            "СЖАТЫЙ ЗАПРОС (JSON):\n" + orjson.dumps(compressed_msg.model_dump()).decode()
+        )
 
     # Добавляем выдержку из истории
     compressed = compress_history(req.history, max_items=5)
@@ -95,22 +92,13 @@ async def single_agent(
 
     try:
         # Получаем ответ от агента
-        raw_response, agent_usage = ask_gigachat(req.agent, full_content, track_usage=req.debug)
+        raw_response, agent_usage = await ask_gigachat(req.agent, full_content, track_usage=req.debug)
 
         # Парсим JSON ответ
-        import json
-        try:
-            compressed_response = json.loads(raw_response)
-        except json.JSONDecodeError:
-            logger.warning("Agent %s returned non-JSON: %s", req.agent, raw_response[:100])
-            compressed_response = {
-                "verdict": "NO-DATA",
-                "confidence": 0,
-                "raw_response": raw_response[:500]
-            }
+        compressed_response, _ = parse_agent_json(raw_response, req.agent)
 
         # Разворачиваем в читаемый текст
-        expanded_text, expander_usage = expand_agent_output(req.agent, compressed_response, track_usage=req.debug)
+        expanded_text, expander_usage = await expand_agent_output(req.agent, compressed_response, track_usage=req.debug)
 
         # Собираем ответ
         reply = AgentReplyV2(
@@ -185,22 +173,13 @@ async def recalc_summary(
 
     try:
         # Получаем ответ от саммари агента
-        raw_response, summary_usage = ask_gigachat("summary", summary_input, track_usage=req.debug)
+        raw_response, summary_usage = await ask_gigachat("summary", summary_input, track_usage=req.debug)
 
         # Парсим JSON ответ
-        import json
-        try:
-            compressed_response = json.loads(raw_response)
-        except json.JSONDecodeError:
-            logger.warning("Summary returned non-JSON: %s", raw_response[:100])
-            compressed_response = {
-                "verdict": "NO-DATA",
-                "confidence": 0,
-                "raw_response": raw_response[:500]
-            }
+        compressed_response, _ = parse_agent_json(raw_response, "summary")
 
         # Разворачиваем в читаемый текст
-        expanded_text, expander_usage = expand_agent_output("summary", compressed_response, track_usage=req.debug)
+        expanded_text, expander_usage = await expand_agent_output("summary", compressed_response, track_usage=req.debug)
 
         # Собираем ответ
         reply = AgentReplyV2(
@@ -4,9 +4,14 @@
 """
 
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from auth import create_token_pair, verify_refresh_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.auth import (
+    create_token_pair,
+    create_access_token,
+    verify_refresh_token,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+)
 from db import get_db, create_user_if_not_exists
 from app.schemas import LoginRequest, TokenResponse, RefreshTokenRequest, AccessTokenResponse
 from app.core.logger import logger
@@ -18,7 +23,7 @@ router = APIRouter(prefix="/api", tags=["auth"])
 @router.post("/login", response_model=TokenResponse)
 async def login(
     body: LoginRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> TokenResponse:
     """
     Логин: принимает user_id, создаёт пользователя, возвращает пару токенов.
@@ -30,10 +35,10 @@ async def login(
     Returns:
         TokenResponse: access_token + refresh_token
     """
-    create_user_if_not_exists(db, body.user_id)
+    await create_user_if_not_exists(db, body.user_id)
     token_pair = create_token_pair(body.user_id)
     
-    logger.info(f"User {body.user_id} logged in, issued token pair")
+    logger.info("User %s logged in, issued token pair", body.user_id)
     
     return token_pair
 
@@ -57,10 +62,9 @@ async def refresh_access_token(body: RefreshTokenRequest) -> AccessTokenResponse
     user_id = verify_refresh_token(body.refresh_token)
     
     # Выдаём новый access_token (из auth.py)
-    from auth import create_access_token
     new_access_token = create_access_token(user_id)
     
-    logger.info(f"User {user_id} refreshed access token")
+    logger.info("User %s refreshed access token", user_id)
     
     return AccessTokenResponse(
         access_token=new_access_token,
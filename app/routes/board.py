@@ -1,20 +1,23 @@
 """
 Основной endpoint для совета директоров.
 /api/board — главная бизнес-логика приложения.
+/api/board/stream — те же ответы потоком NDJSON, по мере готовности.
 """
 
-import json
-from typing import List, Optional, Dict
-from fastapi import APIRouter, Request, Depends
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import orjson
+import asyncio
+from typing import AsyncIterator, List, Optional, Dict, Tuple
+from fastapi import APIRouter, Request, Depends, Header
+from fastapi.responses import StreamingResponse
 
 from app.core.logger import logger
+from app.core.rate_limit import limiter
 from app.core.config import RATE_LIMIT_BOARD_CHAT
 from app.schemas import (
     ChatRequest,
     ChatResponseV2,
     AgentReplyV2,
+    CompressedMessage,
 )
 from app.llm import (
     ask_gigachat,
@@ -23,64 +26,180 @@ from app.llm import (
     compress_history,
     create_debug_metadata,
 )
+from app.llm.parse import parse_agent_json
+from app.cache import get_idempotent_compressed, cache_idempotent_compressed
 from app.services.prompts import AGENT_PARAMS
-from auth import verify_token
-
-# Лимитер для rate limiting
-limiter = Limiter(key_func=get_remote_address)
+from app.auth import verify_token
 
 # Создаём router для board endpoints
 router = APIRouter(prefix="/api", tags=["board"])
 
-# Порядок агентов при выводе
-AGENT_ORDER = ["ceo", "cfo", "cpo", "marketing", "skeptic"]
+# Порядок агентов при выводе (кортеж — создаётся один раз на модуль)
+AGENT_ORDER = ("ceo", "cfo", "cpo", "marketing", "skeptic")
 
+# Позиция ответа в /api/board (summary и error — после всех агентов)
+_REPLY_POSITION = {agent: idx for idx, agent in enumerate(AGENT_ORDER)}
 
-@router.post("/board", response_model=ChatResponseV2)
-@limiter.limit(RATE_LIMIT_BOARD_CHAT)
-async def board_chat(
-    req: ChatRequest,
-    request: Request,
-    user_id: str = Depends(verify_token),
-) -> ChatResponseV2:
+
+async def _ask_agent(agent: str, agent_input: str, debug: bool) -> Tuple[dict, dict]:
     """
-    Оптимизированный endpoint совета директоров.
-    
-    流程:
-    1. Сжимает исходное сообщение пользователя
-    2. Вызывает всех активных агентов по очереди
-    3. Каждый агент видит мнения предыдущих
-    4. После всех агентов — пересчёт саммари
-    5. Возвращает все ответы + опциональная отладка
-    
-    Args:
-        req: ChatRequest с message, active_agents, history, mode, debug
-        request: FastAPI Request (для rate limiter)
-        user_id: текущий пользователь (из JWT)
-        
+    Спрашивает одного агента и разбирает его сжатый JSON-ответ.
+
     Returns:
-        ChatResponseV2: ответы всех агентов + опциональная отладка
+        Tuple[dict, dict]: (сжатый ответ агента, usage метрики)
     """
-    user_msg = req.message
-    mode = req.mode or "initial"
-    debug = req.debug or False
+    logger.info("Processing agent: %s", agent)
+    # Получаем raw ответ от агента (сжатый JSON). Одновременные вызовы
+    # GigaChat со всего процесса ограничивает семафор клиента (GIGA_CONCURRENCY)
+    raw_response, agent_usage = await ask_gigachat(agent, agent_input, track_usage=debug)
+
+    # Парсим JSON из ответа и проверяем ключевые поля
+    compressed_response, is_valid = parse_agent_json(raw_response, agent, keep_raw_if_incomplete=True)
+    if is_valid:
+        logger.info(
+            "Agent %s returned valid JSON | verdict=%s | confidence=%s",
+            agent,
+            compressed_response.get("verdict", "N/A"),
+            compressed_response.get("confidence", 0),
+        )
+
+    return compressed_response, agent_usage
+
+
+async def _run_agent(
+    agent: str,
+    agent_input: str,
+    debug: bool,
+    user_msg: str,
+    compressed_user_msg: CompressedMessage,
+) -> Tuple[AgentReplyV2, dict]:
+    """
+    Полный цикл одного агента: мнение (сжатый JSON) → развёрнутый текст.
+
+    Returns:
+        Tuple[AgentReplyV2, dict]: (ответ агента, сжатый ответ для саммари)
+    """
+    compressed_response, agent_usage = await _ask_agent(agent, agent_input, debug)
+    expanded_text, expander_usage = await expand_agent_output(agent, compressed_response, track_usage=debug)
+
+    # Собираем ответ агента. Строки свои и уже проверенные —
+    # model_construct пропускает валидацию pydantic.
+    reply = AgentReplyV2.model_construct(
+        agent=agent,
+        text=expanded_text,
+    )
+
+    # Добавляем отладку если нужна
+    if debug:
+        reply.compressed = compressed_response
+        reply.meta = create_debug_metadata(
+            agent=agent,
+            compressed_input={"user_msg": user_msg[:100], "intent": compressed_user_msg.intent},
+            compressed_output=compressed_response,
+            latency_ms=agent_usage.get("latency_ms", 0.0) + expander_usage.get("latency_ms", 0.0),
+            tokens_input=agent_usage.get("tokens_input", 0) + expander_usage.get("tokens_input", 0),
+            tokens_output=agent_usage.get("tokens_output", 0) + expander_usage.get("tokens_output", 0),
+            finish_reason=agent_usage.get("finish_reason", "unknown"),
+        )
+
+    return reply, compressed_response
+
+
+async def _run_agent_safe(
+    agent: str,
+    agent_input: str,
+    debug: bool,
+    user_msg: str,
+    compressed_user_msg: CompressedMessage,
+) -> Tuple[AgentReplyV2, Optional[dict]]:
+    """
+    _run_agent, но ошибка GigaChat у одного агента не роняет весь совет.
+
+    Returns:
+        Tuple[AgentReplyV2, Optional[dict]]: (ответ агента или текст ошибки,
+        сжатый ответ для саммари или None при ошибке)
+    """
+    try:
+        return await _run_agent(agent, agent_input, debug, user_msg, compressed_user_msg)
+    except Exception as e:
+        logger.exception("Error while calling GigaChat | agent=%s", agent)
+        return AgentReplyV2.model_construct(
+            agent=agent,
+            text=f"Ошибка при обращении к GigaChat: {e}",
+        ), None
+
+
+async def _run_summary(summary_input: str, debug: bool) -> AgentReplyV2:
+    """Саммари совета по сжатым мнениям всех агентов."""
+    logger.info("Processing summary agent")
+
+    # Получаем ответ от саммари агента
+    raw_summary, summary_usage = await ask_gigachat("summary", summary_input, track_usage=debug)
+
+    # Парсим JSON
+    compressed_summary, _ = parse_agent_json(raw_summary, "summary")
+
+    # Разворачиваем саммари
+    expanded_summary, expander_summary_usage = await expand_agent_output("summary", compressed_summary, track_usage=debug)
 
+    # Собираем ответ саммари
+    reply = AgentReplyV2.model_construct(
+        agent="summary",
+        text=expanded_summary,
+    )
+
+    if debug:
+        reply.compressed = compressed_summary
+        reply.meta = create_debug_metadata(
+            agent="summary",
+            compressed_output=compressed_summary,
+            latency_ms=summary_usage.get("latency_ms", 0.0) + expander_summary_usage.get("latency_ms", 0.0),
+            tokens_input=summary_usage.get("tokens_input", 0) + expander_summary_usage.get("tokens_input", 0),
+            tokens_output=summary_usage.get("tokens_output", 0) + expander_summary_usage.get("tokens_output", 0),
+            finish_reason=summary_usage.get("finish_reason", "unknown"),
+        )
+
+    return reply
+
+
+async def _prepare_board(
+    req: ChatRequest,
+    user_id: str,
+    endpoint: str,
+    idempotency_key: Optional[str] = None,
+) -> Tuple[List[str], CompressedMessage]:
+    """
+    Общая подготовка /api/board и /api/board/stream.
+
+    Returns:
+        Tuple[List[str], CompressedMessage]: (активные агенты по порядку, сжатое сообщение)
+    """
     logger.info(
-        "Incoming /api/board message: %s | active_agents=%s | mode=%s | debug=%s | user=%s",
-        user_msg[:50],
+        "Incoming %s message: %s | active_agents=%s | mode=%s | debug=%s | user=%s",
+        endpoint,
+        req.message[:50],
         req.active_agents,
-        mode,
-        debug,
+        req.mode or "initial",
+        req.debug or False,
         user_id,
     )
 
     # Определяем порядок агентов
-    order = AGENT_ORDER
-    active = req.active_agents if req.active_agents is not None else order
-    active_ordered = [a for a in order if a in active]
-
-    # Сжимаем исходное сообщение пользователя
-    compressed_user_msg = compress_user_message(user_msg, user_id=user_id)
+    if req.active_agents is None:
+        active_ordered = list(AGENT_ORDER)
+    else:
+        active = set(req.active_agents)
+        active_ordered = [a for a in AGENT_ORDER if a in active]
+
+    # Сжимаем исходное сообщение пользователя.
+    # Повтор с тем же Idempotency-Key (ретрай браузера) берёт готовое сжатие.
+    compressed_user_msg = None
+    if idempotency_key:
+        compressed_user_msg = get_idempotent_compressed(user_id, idempotency_key, req.message)
+    if compressed_user_msg is None:
+        compressed_user_msg = await compress_user_message(req.message, user_id=user_id)
+        if idempotency_key:
+            cache_idempotent_compressed(user_id, idempotency_key, req.message, compressed_user_msg)
     logger.info(
         "Compressed user message | intent=%s | domain=%s | idea_summary=%s",
         compressed_user_msg.intent,
@@ -88,177 +207,128 @@ async def board_chat(
         compressed_user_msg.idea_summary,
     )
 
-    replies: List[AgentReplyV2] = []
-    ctx: Dict[str, dict] = {}  # Контекст для каждого агента (его мнение + usage)
+    return active_ordered, compressed_user_msg
 
-    try:
-        # ===== ЦИКЛ ПО АГЕНТАМ =====
-        for agent in active_ordered:
-            logger.info("Processing agent: %s", agent)
-
-            # Собираем контекст для этого агента
-            parts: List[str] = [
-                "СЖАТЫЙ ЗАПРОС ПОЛЬЗОВАТЕЛЯ (JSON):",
-                json.dumps(compressed_user_msg.dict(), ensure_ascii=False, indent=2),
-            ]
-
-            # Если есть мнения других агентов — добавляем их
-            if ctx:
-                parts.append("\nСЖАТЫЕ МНЕНИЯ ДРУГИХ ЧЛЕНОВ СОВЕТА (JSON):")
-                for prev_agent in order:
-                    if prev_agent in ctx:
-                        parts.append(f"{prev_agent}:")
-                        parts.append(json.dumps(ctx[prev_agent]["compressed"], ensure_ascii=False, indent=2))
-
-            # Добавляем выдержку из истории (последние 5 сообщений)
-            compressed = compress_history(req.history, max_items=5)
-            if compressed:
-                parts.append("\nВЫДЕЖКА ИЗ ИСТОРИИ (последние 5 сообщений):")
-                parts.append(compressed)
-
-            agent_input = "\n".join(parts)
-
-            # Получаем raw ответ от агента (сжатый JSON)
-            raw_response, agent_usage = ask_gigachat(agent, agent_input, track_usage=debug)
-
-            # Парсим JSON из ответа
-            try:
-                compressed_response = json.loads(raw_response)
-                
-                # Валидируем наличие ключевых полей
-                if "verdict" not in compressed_response or "confidence" not in compressed_response:
-                    logger.warning(
-                        "Agent %s returned JSON but missing critical fields | keys=%s",
-                        agent,
-                        list(compressed_response.keys())
-                    )
-                    compressed_response = {
-                        "verdict": "INCOMPLETE",
-                        "confidence": 0,
-                        "raw_response": raw_response,
-                        **compressed_response
-                    }
-                else:
-                    logger.info(
-                        "Agent %s returned valid JSON | verdict=%s | confidence=%d",
-                        agent,
-                        compressed_response.get("verdict", "N/A"),
-                        compressed_response.get("confidence", 0),
-                    )
-            except json.JSONDecodeError as e:
-                logger.warning(
-                    "Agent %s returned non-JSON response: %s | error=%s",
-                    agent,
-                    raw_response[:100],
-                    str(e)
-                )
-                compressed_response = {
-                    "verdict": "NO-DATA",
-                    "confidence": 0,
-                    "raw_response": raw_response[:500]
-                }
-
-            # Сохраняем мнение агента в контекст для следующих
-            ctx[agent] = {"compressed": compressed_response, "usage": agent_usage}
-
-            # Разворачиваем JSON в читаемый текст
-            expanded_text, expander_usage = expand_agent_output(agent, compressed_response, track_usage=debug)
-
-            # Собираем ответ агента
-            reply = AgentReplyV2(
-                agent=agent,
-                text=expanded_text,
-            )
 
-            # Добавляем отладку если нужна
-            if debug:
-                reply.compressed = compressed_response
-                reply.meta = create_debug_metadata(
-                    agent=agent,
-                    compressed_input={"user_msg": user_msg[:100], "intent": compressed_user_msg.intent},
-                    compressed_output=compressed_response,
-                    latency_ms=agent_usage.get("latency_ms", 0.0) + expander_usage.get("latency_ms", 0.0),
-                    tokens_input=agent_usage.get("tokens_input", 0) + expander_usage.get("tokens_input", 0),
-                    tokens_output=agent_usage.get("tokens_output", 0) + expander_usage.get("tokens_output", 0),
-                    finish_reason=agent_usage.get("finish_reason", "unknown"),
-                )
-
-            replies.append(reply)
+async def _board_replies(
+    req: ChatRequest,
+    user_id: str,
+    active_ordered: List[str],
+    compressed_user_msg: CompressedMessage,
+    compressed_user_dict: dict,
+) -> AsyncIterator[AgentReplyV2]:
+    """
+    Выдаёт ответы совета по мере готовности.
 
-        # ===== САММАРИ ПОСЛЕ ВСЕХ АГЕНТОВ =====
-        if mode == "initial":
-            logger.info("Processing summary agent")
-
-            # Собираем контекст для саммари
-            summary_parts: List[str] = [
-                "СЖАТЫЙ ЗАПРОС ПОЛЬЗОВАТЕЛЯ (JSON):",
-                json.dumps(compressed_user_msg.dict(), ensure_ascii=False, indent=2),
-                "",
-                "СЖАТЫЕ МНЕНИЯ СОВЕТА (JSON):",
-            ]
-
-            for agent in active_ordered:
-                if agent in ctx:
-                    summary_parts.append(f"{agent}:")
-                    summary_parts.append(json.dumps(ctx[agent]["compressed"], ensure_ascii=False, indent=2))
-
-            summary_input = "\n".join(summary_parts)
-
-            # Получаем ответ от саммари агента
-            raw_summary, summary_usage = ask_gigachat("summary", summary_input, track_usage=debug)
-
-            # Парсим JSON
-            try:
-                compressed_summary = json.loads(raw_summary)
-                if "verdict" not in compressed_summary or "confidence" not in compressed_summary:
-                    logger.warning(
-                        "Summary returned JSON but missing critical fields | keys=%s",
-                        list(compressed_summary.keys())
-                    )
-                    compressed_summary = {
-                        "verdict": "INCOMPLETE",
-                        "confidence": 0,
-                        **compressed_summary
-                    }
-            except json.JSONDecodeError:
-                logger.warning("Summary agent returned non-JSON: %s", raw_summary[:100])
-                compressed_summary = {
-                    "verdict": "NO-DATA",
-                    "confidence": 0,
-                    "raw_response": raw_summary[:500]
-                }
-
-            # Разворачиваем саммари
-            expanded_summary, expander_summary_usage = expand_agent_output("summary", compressed_summary, track_usage=debug)
-
-            # Собираем ответ саммари
-            reply = AgentReplyV2(
-                agent="summary",
-                text=expanded_summary,
-            )
+    Агенты работают параллельно, каждый отдаётся сразу после
+    разворачивания (порядок — по времени готовности). Саммари — последним,
+    когда известны все мнения. Ошибка GigaChat превращается в ответ "error".
+    """
+    user_msg = req.message
+    mode = req.mode or "initial"
+    debug = req.debug or False
 
-            if debug:
-                reply.compressed = compressed_summary
-                reply.meta = create_debug_metadata(
-                    agent="summary",
-                    compressed_output=compressed_summary,
-                    latency_ms=summary_usage.get("latency_ms", 0.0) + expander_summary_usage.get("latency_ms", 0.0),
-                    tokens_input=summary_usage.get("tokens_input", 0) + expander_summary_usage.get("tokens_input", 0),
-                    tokens_output=summary_usage.get("tokens_output", 0) + expander_summary_usage.get("tokens_output", 0),
-                    finish_reason=summary_usage.get("finish_reason", "unknown"),
-                )
+    ctx: Dict[str, str] = {}  # Контекст для саммари: агент -> сжатое мнение (JSON)
 
-            replies.append(reply)
+    # Общие для всех агентов и саммари части входа — считаем один раз.
+    # JSON компактный: отступы только раздувают токены, модели они не нужны.
+    compressed_user_json = orjson.dumps(compressed_user_dict).decode()
+    compressed_history_snippet = compress_history(req.history, max_items=5)
+
+    user_prefix = "СЖАТЫЙ ЗАПРОС ПОЛЬЗОВАТЕЛЯ (JSON):\n" + compressed_user_json
+    history_suffix = (
+        "\n\nВЫДЕЖКА ИЗ ИСТОРИИ (последние 5 сообщений):\n" + compressed_history_snippet
+        if compressed_history_snippet
+        else ""
+    )
+
+    # ===== НЕЗАВИСИМЫЕ МНЕНИЯ АГЕНТОВ (ПАРАЛЛЕЛЬНО) =====
+    # Все агенты получают одинаковый вход и не зависят друг от друга,
+    # поэтому время ответа — max(Tᵢ), а не Σ Tᵢ.
+    # Зависимый шаг — только саммари, он ниже.
+    agent_input = user_prefix + history_suffix
+
+    logger.info("Processing agents in parallel: %s", active_ordered)
+    tasks = [
+        asyncio.create_task(_run_agent_safe(agent, agent_input, debug, user_msg, compressed_user_msg))
+        for agent in active_ordered
+    ]
+
+    try:
+        # Упавший агент отдаёт свой текст ошибки, остальные продолжают работу
+        for next_done in asyncio.as_completed(tasks):
+            reply, compressed_response = await next_done
+            if compressed_response is not None:
+                ctx[reply.agent] = orjson.dumps(compressed_response).decode()
+            yield reply
+
+        # ===== САММАРИ ПОСЛЕ ВСЕХ АГЕНТОВ =====
+        # Без единого мнения саммари не из чего собирать
+        if mode == "initial" and ctx:
+            # Собираем контекст для саммари: общий префикс + мнения агентов
+            opinions = "".join(
+                f"\n{agent}:\n{ctx[agent]}"
+                for agent in active_ordered
+                if agent in ctx
+            )
+            summary_input = user_prefix + "\n\nСЖАТЫЕ МНЕНИЯ СОВЕТА (JSON):" + opinions
+            yield await _run_summary(summary_input, debug)
 
     except Exception as e:
         logger.exception("Error while calling GigaChat board chain | user=%s", user_id)
-        replies.append(
-            AgentReplyV2(
-                agent="error",
-                text=f"Ошибка при обращении к GigaChat: {e}",
-            )
+        yield AgentReplyV2.model_construct(
+            agent="error",
+            text=f"Ошибка при обращении к GigaChat: {e}",
         )
 
+    finally:
+        # Ошибка или клиент отключился — не оставляем висящие запросы к GigaChat
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+@router.post("/board", response_model=ChatResponseV2)
+@limiter.limit(RATE_LIMIT_BOARD_CHAT)
+async def board_chat(
+    req: ChatRequest,
+    request: Request,
+    user_id: str = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None),
+) -> ChatResponseV2:
+    """
+    Оптимизированный endpoint совета директоров.
+    
+    流程:
+    1. Сжимает исходное сообщение пользователя
+    2. Вызывает всех активных агентов параллельно (независимые мнения)
+    3. Каждый ответ разворачивается в текст сразу, как готов
+    4. После всех агентов — саммари, которое видит все мнения
+    5. Возвращает все ответы + опциональная отладка
+    
+    Args:
+        req: ChatRequest с message, active_agents, history, mode, debug
+        request: FastAPI Request (для rate limiter)
+        user_id: текущий пользователь (из JWT)
+        idempotency_key: заголовок Idempotency-Key (повторы не сжимают сообщение заново)
+        
+    Returns:
+        ChatResponseV2: ответы всех агентов + опциональная отладка
+    """
+    debug = req.debug or False
+    active_ordered, compressed_user_msg = await _prepare_board(req, user_id, "/api/board", idempotency_key)
+    # Один обход модели pydantic на запрос: и для промптов, и для отладки
+    compressed_user_dict = compressed_user_msg.model_dump()
+
+    replies: List[AgentReplyV2] = [
+        reply async for reply in _board_replies(
+            req, user_id, active_ordered, compressed_user_msg, compressed_user_dict
+        )
+    ]
+
+    # Агенты приходят по готовности — возвращаем в порядке AGENT_ORDER
+    replies.sort(key=lambda r: _REPLY_POSITION.get(r.agent, len(AGENT_ORDER)))
+
     logger.info(
         "Outgoing /api/board | agents=%s | reply_count=%d | debug=%s",
         active_ordered,
@@ -268,6 +338,58 @@ async def board_chat(
 
     return ChatResponseV2(
         agents=replies,
-        user_message_compressed=compressed_user_msg.dict() if debug else None,
+        user_message_compressed=compressed_user_dict if debug else None,
         debug=debug,
     )
+
+
+@router.post("/board/stream")
+@limiter.limit(RATE_LIMIT_BOARD_CHAT)
+async def board_chat_stream(
+    req: ChatRequest,
+    request: Request,
+    user_id: str = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """
+    Совет директоров потоком NDJSON.
+    
+    Каждая строка — AgentReplyV2, отправляется сразу, как агент готов:
+    первый ответ приходит через T₁, а не после всего совета.
+    Саммари — предпоследняя строка, последняя — {"done": true, ...}.
+    
+    Args:
+        req: ChatRequest с message, active_agents, history, mode, debug
+        request: FastAPI Request (для rate limiter)
+        user_id: текущий пользователь (из JWT)
+        idempotency_key: заголовок Idempotency-Key (повторы не сжимают сообщение заново)
+        
+    Returns:
+        StreamingResponse: application/x-ndjson
+    """
+    debug = req.debug or False
+    active_ordered, compressed_user_msg = await _prepare_board(req, user_id, "/api/board/stream", idempotency_key)
+    compressed_user_dict = compressed_user_msg.model_dump()
+
+    async def ndjson_lines() -> AsyncIterator[bytes]:
+        reply_count = 0
+        async for reply in _board_replies(
+            req, user_id, active_ordered, compressed_user_msg, compressed_user_dict
+        ):
+            reply_count += 1
+            yield orjson.dumps(reply.model_dump()) + b"\n"
+
+        yield orjson.dumps({
+            "done": True,
+            "user_message_compressed": compressed_user_dict if debug else None,
+            "debug": debug,
+        }) + b"\n"
+
+        logger.info(
+            "Outgoing /api/board/stream | agents=%s | reply_count=%d | debug=%s",
+            active_ordered,
+            reply_count,
+            debug,
+        )
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
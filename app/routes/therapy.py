@@ -3,18 +3,36 @@
 /api/therapy — главный эндпоинт для сессий терапии.
 """
 
-import json
-import uuid
-from typing import List, Optional
-from datetime import datetime, timezone
-from fastapi import APIRouter, Request, Depends
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import orjson
+from secrets import token_hex
+import asyncio
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Request, Depends, Header, HTTPException, status
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.logger import logger
-from app.core.config import RATE_LIMIT_BOARD_CHAT
-from app.schemas import ChatRequest
+from app.core.rate_limit import limiter
+from app.core.config import (
+    RATE_LIMIT_BOARD_CHAT,
+    HYPOTHESIS_SIMILARITY_THRESHOLD,
+    HYPOTHESIS_LOCAL_DEDUP_MAX,
+)
+from app.schemas import (
+    TherapyRequest,
+    TherapyResponse,
+    TherapyKeyInsightSchema,
+    TherapyHypothesisSchema,
+)
 from app.llm import ask_gigachat
+from app.llm.parse import parse_json_object
+from app.cache import (
+    get_similar_hypotheses,
+    cache_similar_hypotheses,
+    get_therapy_retry,
+    cache_therapy_retry,
+)
 from app.services.prompts import (
     AGENT_PARAMS,
     THERAPY_SYSTEM_PROMPT,
@@ -22,110 +40,227 @@ from app.services.prompts import (
     HYPOTHESIS_DEDUPLICATOR_SYSTEM_PROMPT,
 )
 from db import (
-    SessionLocal,
     get_db,
+    utcnow,
     TherapySession,
     TherapyMessage,
     TherapyKeyInsight,
     TherapyHypothesis,
     User,
 )
-from auth import verify_token
-
-# Лимитер для rate limiting
-limiter = Limiter(key_func=get_remote_address)
+from app.auth import verify_token
 
 # Создаём router для therapy endpoints
 router = APIRouter(prefix="/api", tags=["therapy"])
 
 
-# ===== SCHEMAS =====
-
-from pydantic import BaseModel
-
-class TherapyKeyInsightSchema(BaseModel):
-    """Ключевое знание для ответа."""
-    id: str
-    insight_summary: str
-    confidence: int
-    importance: int
-
-
-class TherapyHypothesisSchema(BaseModel):
-    """Гипотеза для ответа."""
-    id: str
-    hypothesis_text: str
-    confidence: int
-    is_ready_for_board: bool
+# ===== HELPER FUNCTIONS =====
 
+# Подписи ролей в истории контекста (всё, что не user, — реплики Терапевта)
+_ROLE_LABELS = {"user": "Пользователь", "therapist": "Терапевт"}
 
-class TherapyRequest(BaseModel):
-    """Запрос к Терапевту."""
-    session_id: Optional[str] = None  # None если новая сессия
-    message: str
 
+async def get_recent_messages(db: AsyncSession, session_id: str, limit: int = 10) -> List[TherapyMessage]:
+    """
+    Последние limit сообщений сессии в хронологическом порядке.
+    
+    Сортировка и LIMIT выполняются в SQL — всю историю сессии не грузим.
+    """
+    result = await db.execute(
+        select(TherapyMessage)
+        .where(TherapyMessage.session_id == session_id)
+        .order_by(TherapyMessage.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())[::-1]
 
-class TherapyResponse(BaseModel):
-    """Ответ от Терапевта."""
-    session_id: str
-    therapist_message: str
-    key_insights: List[TherapyKeyInsightSchema]
-    hypotheses: List[TherapyHypothesisSchema]
-    ready_for_board: bool
 
+async def get_context_rows(
+    db: AsyncSession,
+    session_id: str,
+    max_deleted_insights: int = 20,
+    max_hypotheses: int = 10,
+) -> Tuple[List[TherapyKeyInsight], List[TherapyKeyInsight], List[TherapyHypothesis]]:
+    """
+    Загружает инсайты и гипотезы для контекста Терапевта.
+    
+    Фильтры, сортировка и LIMIT выполняются в SQL (по составным индексам),
+    в Python приходят только нужные строки.
+    
+    Returns:
+        (активные и удалённые инсайты в порядке появления, топ гипотез по confidence)
+    """
+    active_insights = (await db.execute(
+        select(TherapyKeyInsight)
+        .where(
+            TherapyKeyInsight.session_id == session_id,
+            TherapyKeyInsight.is_deleted_by_user.is_(False),
+        )
+        .order_by(TherapyKeyInsight.display_order, TherapyKeyInsight.id)
+    )).scalars().all()
+    deleted_insights = (await db.execute(
+        select(TherapyKeyInsight)
+        .where(
+            TherapyKeyInsight.session_id == session_id,
+            TherapyKeyInsight.is_deleted_by_user.is_(True),
+        )
+        .order_by(TherapyKeyInsight.display_order, TherapyKeyInsight.id)
+        .limit(max_deleted_insights)
+    )).scalars().all()
+    top_hypotheses = (await db.execute(
+        select(TherapyHypothesis)
+        .where(
+            TherapyHypothesis.session_id == session_id,
+            TherapyHypothesis.is_active.is_(True),
+            TherapyHypothesis.is_selected_by_user.is_(False),
+        )
+        .order_by(TherapyHypothesis.confidence.desc().nulls_last())
+        .limit(max_hypotheses)
+    )).scalars().all()
+    return list(active_insights), list(deleted_insights), list(top_hypotheses)
 
-# ===== HELPER FUNCTIONS =====
 
-def get_therapy_context(session: TherapySession, max_recent_messages: int = 10) -> str:
+def get_therapy_context(
+    session: TherapySession,
+    active_insights: List[TherapyKeyInsight],
+    deleted_insights: List[TherapyKeyInsight],
+    top_hypotheses: List[TherapyHypothesis],
+    recent_messages: List[TherapyMessage],
+) -> Tuple[str, str]:
     """
     Собирает контекст для Терапевта.
     
-    Состав:
-    1. Исходная проблема
-    2. Ключевые знания (отсортированы по importance)
-    3. Удаленные знания (для анализа Терапевтом)
-    4. ТЕКУЩИЕ ГИПОТЕЗЫ (отсортированы по confidence)
-    5. Последние N сообщений из истории
+    Строки уже отфильтрованы и отсортированы в SQL
+    (get_context_rows, get_recent_messages).
+    
+    Контекст делится на две части, чтобы GigaChat переиспользовал
+    кэш префикса между ходами:
+    - префикс меняется редко и только дописывается в конец:
+      1. Исходная проблема
+      2. Ключевые знания (в порядке появления, display_order)
+      3. Удаленные знания (для анализа Терапевтом)
+    - хвост меняется каждый ход:
+      4. ТЕКУЩИЕ ГИПОТЕЗЫ (отсортированы по confidence)
+      5. Последние N сообщений из истории
+    
+    Returns:
+        (стабильный префикс, изменяемый хвост)
     """
-    parts = []
+    prefix = []
+    suffix = []
     
     # 1. Исходная проблема
-    parts.append("ИСХОДНАЯ ПРОБЛЕМА:")
-    parts.append(session.initial_problem)
+    prefix.append("ИСХОДНАЯ ПРОБЛЕМА:")
+    prefix.append(session.initial_problem)
     
-    # 2. Ключевые знания (активные)
-    active_insights = [i for i in session.key_insights if not i.is_deleted_by_user]
+    # 2. Ключевые знания (активные). Порядок по display_order, а не по importance:
+    # изменение оценки важности не должно сдвигать строки и ломать кэш префикса
     if active_insights:
-        parts.append("\nКЛЮЧЕВЫЕ ЗНАНИЯ (отсортированы по важности):")
-        for insight in sorted(active_insights, key=lambda x: x.importance, reverse=True):
-            parts.append(f"- {insight.insight_summary} (уверенность: {insight.confidence}%)")
+        prefix.append("\nКЛЮЧЕВЫЕ ЗНАНИЯ (в порядке появления):")
+        prefix.extend(
+            f"- {insight.insight_summary} "
+            f"(уверенность: {insight.confidence}%, важность: {insight.importance}%)"
+            for insight in active_insights
+        )
     
     # 3. Удаленные знания (для анализа Терапевтом)
-    deleted_insights = [i for i in session.key_insights if i.is_deleted_by_user]
     if deleted_insights:
-        parts.append("\nРАНЕЕ УПОМЯНУТЫЕ (но удаленные пользователем):")
-        for insight in deleted_insights:
-            parts.append(f"- {insight.insight_summary}")
+        prefix.append("\nРАНЕЕ УПОМЯНУТЫЕ (но удаленные пользователем):")
+        prefix.extend(f"- {insight.insight_summary}" for insight in deleted_insights)
     
     # 4. ТЕКУЩИЕ ГИПОТЕЗЫ - отсортированы по confidence (убывание), топ-10
-    active_hypotheses = [h for h in session.hypotheses if h.is_active and not h.is_selected_by_user]
-    if active_hypotheses:
-        sorted_hypotheses = sorted(active_hypotheses, key=lambda x: x.confidence or 0, reverse=True)
-        top_hypotheses = sorted_hypotheses[:10]
-        
-        parts.append("\nТЕКУЩИЕ ГИПОТЕЗЫ (отсортированы по confidence):")
-        for idx, hyp in enumerate(top_hypotheses, 1):
-            parts.append(f"{idx}. [{hyp.id[:8]}] {hyp.hypothesis_text} (confidence: {hyp.confidence}%)")
+    if top_hypotheses:
+        suffix.append("ТЕКУЩИЕ ГИПОТЕЗЫ (отсортированы по confidence):")
+        suffix.extend(
+            f"{idx}. [{hyp.id[:8]}] {hyp.hypothesis_text} (confidence: {hyp.confidence}%)"
+            for idx, hyp in enumerate(top_hypotheses, 1)
+        )
     
     # 5. Последние N сообщений
-    recent_messages = sorted(session.messages, key=lambda x: x.created_at)[-max_recent_messages:]
     if recent_messages:
-        parts.append(f"\nПОСЛЕДНИЕ {len(recent_messages)} СООБЩЕНИЙ:")
-        for msg in recent_messages:
-            role = "Пользователь" if msg.role == "user" else "Терапевт"
-            parts.append(f"{role}: {msg.content}")
+        suffix.append(f"\nПОСЛЕДНИЕ {len(recent_messages)} СООБЩЕНИЙ:")
+        suffix.extend(
+            f"{_ROLE_LABELS.get(msg.role, 'Терапевт')}: {msg.content}"
+            for msg in recent_messages
+        )
+    
+    return "\n".join(prefix), "\n".join(suffix).lstrip("\n")
+
+
+def _normalize_hypothesis_text(text: str) -> str:
+    """Текст гипотезы как отсортированный набор слов (порядок слов не важен)."""
+    return " ".join(sorted(set(text.lower().split())))
+
+
+def _hypothesis_list(response: dict, key: str) -> List[dict]:
+    """
+    Список гипотез из ответа Генератора или Дедупликатора.
+
+    Модель может вернуть null, строку или объект вместо списка, а в списке —
+    не объекты: такое отбрасывается, чтобы len() и .get() ниже не падали.
+    """
+    items = response.get(key)
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+def dedup_hypotheses_locally(hypotheses: List[dict]) -> List[dict]:
+    """
+    Убирает очевидные дубли гипотез без LLM.
+    
+    Гипотеза отбрасывается, если её набор слов похож на уже оставленную
+    (difflib ratio >= HYPOTHESIS_SIMILARITY_THRESHOLD). Порядок сохраняется:
+    обновлённые старые гипотезы идут первыми и выигрывают у новых.
+    """
+    kept: List[dict] = []
+    kept_normalized: List[str] = []
     
-    return "\n".join(parts)
+    for hyp in hypotheses:
+        if not isinstance(hyp, dict):
+            continue
+        normalized = _normalize_hypothesis_text(hyp.get("hypothesis_text") or "")
+        if not normalized:
+            continue
+        
+        is_duplicate = False
+        for other in kept_normalized:
+            matcher = SequenceMatcher(None, normalized, other)
+            # quick_ratio — дешёвая верхняя граница, ratio считаем только если он может пройти
+            if matcher.quick_ratio() >= HYPOTHESIS_SIMILARITY_THRESHOLD and matcher.ratio() >= HYPOTHESIS_SIMILARITY_THRESHOLD:
+                is_duplicate = True
+                break
+        
+        if not is_duplicate:
+            kept.append(hyp)
+            kept_normalized.append(normalized)
+    
+    return kept
+
+
+async def generate_hypotheses(
+    session_id: str,
+    state_ids: List[str],
+    context_tail: str,
+    user_msg: str,
+    hypothesis_input: str,
+) -> str:
+    """
+    Сырой ответ Генератора гипотез.
+    
+    Если состояние сессии (id инсайтов и гипотез, хвост контекста с последними
+    сообщениями) не изменилось, а пользователь пишет почти то же самое — берём
+    прошлый ответ из кэша без вызова GigaChat.
+    """
+    cached = get_similar_hypotheses(session_id, state_ids, context_tail, user_msg)
+    if cached is not None:
+        return cached
+    
+    response_text, _ = await ask_gigachat(
+        "therapy_hypothesis_generator", hypothesis_input, cache_session=session_id
+    )
+    cache_similar_hypotheses(session_id, state_ids, context_tail, user_msg, response_text)
+    return response_text
 
 
 # ===== API ENDPOINTS =====
@@ -136,17 +271,20 @@ async def therapy_chat(
     req: TherapyRequest,
     request: Request,
     user_id: str = Depends(verify_token),
-    db = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
 ) -> TherapyResponse:
     """
     Основной эндпоинт для диалога с Терапевтом.
     
     Flow:
     1. Если session_id = None → создаём новую сессию
-    2. Сохраняем сообщение пользователя в БД
+    2. Добавляем сообщение пользователя в историю контекста
+       (в БД — вместе с ответом Терапевта)
     3. Собираем контекст для Терапевта
-    4. Вызываем Терапевта (спрашиваем пользователя)
-    5. Генерируем гипотезы отдельным запросом
+    4. Параллельно вызываем Терапевта (спрашиваем пользователя)
+       и Генератор гипотез — у них общий контекст
+    5. Дедуплицируем гипотезы и сохраняем
     6. Возвращаем ответ с обновленными insights и hypotheses
     """
     
@@ -160,11 +298,18 @@ async def therapy_chat(
         user_id,
     )
     
+    # Повтор запроса с тем же Idempotency-Key (ретрай клиента) — отдаём прошлый ответ.
+    # Без ключа одинаковый текст — это новый ответ пользователя, не повтор.
+    if idempotency_key:
+        retry_response = get_therapy_retry(user_id, idempotency_key, user_msg)
+        if retry_response is not None:
+            return retry_response
+    
     # ===== ЭТАП 1: СОЗДАНИЕ ИЛИ ЗАГРУЗКА СЕССИИ =====
     
     if not session_id:
         # Новая сессия
-        session_id = str(uuid.uuid4())
+        session_id = token_hex(16)
         session = TherapySession(
             id=session_id,
             user_id=user_id,
@@ -172,43 +317,94 @@ async def therapy_chat(
             status="ongoing",
         )
         db.add(session)
-        db.commit()
-        db.refresh(session)
+        await db.flush()
         
         logger.info("Created new therapy session: %s", session_id)
     else:
-        # Загружаем существующую
-        session = db.query(TherapySession).filter(
-            TherapySession.id == session_id,
-            TherapySession.user_id == user_id,
-        ).first()
+        # Загружаем существующую по первичному ключу (через identity map),
+        # владельца проверяем в Python
+        session = await db.get(TherapySession, session_id)
         
-        if not session:
+        if session is None or session.user_id != user_id:
+            # Чужую сессию не отличаем от несуществующей
             logger.error("Session not found: %s for user %s", session_id, user_id)
-            raise ValueError(f"Сессия {session_id} не найдена")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Сессия {session_id} не найдена",
+            )
     
-    # ===== ЭТАП 2: СОХРАНИТЬ СООБЩЕНИЕ ПОЛЬЗОВАТЕЛЯ =====
+    # ===== ЭТАП 2: СООБЩЕНИЕ ПОЛЬЗОВАТЕЛЯ =====
     
+    # В БД сообщение уйдёт вместе с ответом Терапевта одним пакетным INSERT
+    # при commit, в историю контекста добавляем его сразу. created_at задаём
+    # явно: оба сообщения вставляются в одном flush, порядок должен сохраниться.
     user_message = TherapyMessage(
-        id=str(uuid.uuid4()),
+        id=token_hex(16),
         session_id=session_id,
         role="user",
         content=user_msg,
+        created_at=utcnow(),
     )
-    db.add(user_message)
-    db.commit()
     
-    # ===== ЭТАП 3: СОБРАТЬ КОНТЕКСТ И ВЫЗВАТЬ ТЕРАПЕВТА =====
-    
-    context = get_therapy_context(session)
+    # Новая сессия пуста — не ходим в БД за инсайтами, гипотезами и историей
+    if req.session_id:
+        active_insights, deleted_insights, top_hypotheses = await get_context_rows(db, session_id)
+        recent_messages = await get_recent_messages(db, session_id, limit=9)
+        recent_messages.append(user_message)
+        # Все id гипотез сессии (только колонка id, без ORM объектов):
+        # ключ кэша Генератора и выбор UPDATE/INSERT при сохранении
+        existing_hyp_ids = set((await db.execute(
+            select(TherapyHypothesis.id).where(TherapyHypothesis.session_id == session_id)
+        )).scalars())
+    else:
+        active_insights, deleted_insights, top_hypotheses = [], [], []
+        recent_messages = [user_message]
+        existing_hyp_ids = set()
+    
+    # ===== ЭТАП 3: СОБРАТЬ КОНТЕКСТ, ВЫЗВАТЬ ТЕРАПЕВТА И ГЕНЕРАТОР =====
+    
+    # Терапевт и Генератор гипотез читают один и тот же контекст и не зависят
+    # друг от друга — запускаем их одновременно. Новый инсайт Терапевта
+    # попадёт в контекст Генератора на следующем ходе.
+    # Общий префикс идёт первым в обоих запросах, инструкции Генератора — в самом конце
+    context_prefix, context_suffix = get_therapy_context(
+        session, active_insights, deleted_insights, top_hypotheses, recent_messages
+    )
+    context = f"{context_prefix}\n\n{context_suffix}" if context_suffix else context_prefix
     therapy_input = f"{context}\n\nТекущий ответ пользователя: {user_msg}"
     
-    # Вызываем Терапевта (он спрашивает пользователя)
-    therapist_raw_response, usage = ask_gigachat(
-        "therapy",
-        therapy_input,
-        track_usage=False,
+    hypothesis_input = f"""{context}
+
+Текущий ответ пользователя: {user_msg}
+
+На основе всей информации выше, проанализируй:
+1. Какие текущие гипотезы нужно обновить по confidence?
+2. Какие НОВЫЕ гипотезы возникают?
+
+Помни: твоя задача не дублировать, а ОБНОВЛЯТЬ и ГЕНЕРИРОВАТЬ."""
+    
+    state_ids = [i.id for i in active_insights] + [i.id for i in deleted_insights] + list(existing_hyp_ids)
+    therapist_task = asyncio.create_task(
+        ask_gigachat("therapy", therapy_input, track_usage=False, cache_session=session_id)
+    )
+    gen_task = asyncio.create_task(
+        generate_hypotheses(session_id, state_ids, context_suffix, user_msg, hypothesis_input)
     )
+    try:
+        (therapist_raw_response, usage), gen_response_raw = await asyncio.gather(
+            therapist_task, gen_task
+        )
+    except BaseException:
+        # Один вызов упал (или клиент ушёл) — второй отменяем, чтобы не оставлять
+        # осиротевшую задачу. Сам HTTP-запрос к GigaChat защищён asyncio.shield
+        # (его могут ждать одинаковые запросы) и доработает до конца, удерживая
+        # слот семафора; его ответ попадёт в кэш. На прод Python 3.10,
+        # поэтому вручную, а не через asyncio.TaskGroup.
+        for task in (therapist_task, gen_task):
+            task.cancel()
+        # Дожидаемся отмены и забираем исключение второй задачи
+        await asyncio.gather(therapist_task, gen_task, return_exceptions=True)
+        raise
     
     logger.info(
         "Therapist responded | session_id=%s | response=%s",
@@ -217,8 +413,12 @@ async def therapy_chat(
     )
     
     # Парсим JSON ответ от Терапевта
-    try:
-        therapist_response = json.loads(therapist_raw_response)
+    therapist_response = parse_json_object(therapist_raw_response)
+    if therapist_response is None:
+        logger.warning("Therapist returned non-JSON: %s", therapist_raw_response[:100])
+        therapist_message = therapist_raw_response
+        therapist_response = {}
+    else:
         therapist_message = therapist_response.get("question", "")
         
         # Экстрактим ключевое знание из ответа пользователя (если есть и не пусто)
@@ -226,56 +426,39 @@ async def therapy_chat(
         if "key_insight" in therapist_response and key_insight_text:
             # ✅ Создаём инсайт только если текст непуст
             insight = TherapyKeyInsight(
-                id=str(uuid.uuid4()),
+                id=token_hex(16),
                 session_id=session_id,
                 question=therapist_response.get("question_asked", ""),
                 answer=user_msg,
                 insight_summary=key_insight_text,
                 confidence=therapist_response.get("insight_confidence", 80),
                 importance=therapist_response.get("insight_importance", 80),
-                display_order=len(session.key_insights),
+                # Порядковый номер считает сама БД подзапросом в INSERT:
+                # удалённые инсайты в контекст грузятся с LIMIT, их len() не годится
+                display_order=(
+                    select(func.count())
+                    .select_from(TherapyKeyInsight)
+                    .where(TherapyKeyInsight.session_id == session_id)
+                    .scalar_subquery()
+                ),
             )
             db.add(insight)
-            db.commit()
             
             logger.info("Saved key insight: %s", insight.insight_summary)
     
-    except json.JSONDecodeError as e:
-        logger.warning("Therapist returned non-JSON: %s", e)
-        therapist_message = therapist_raw_response
-        therapist_response = {}
-    
     # ===== ЭТАП 4: СОХРАНИТЬ ОТВЕТ ТЕРАПЕВТА =====
     
     therapist_message_obj = TherapyMessage(
-        id=str(uuid.uuid4()),
+        id=token_hex(16),
         session_id=session_id,
         role="therapist",
         content=therapist_message,
     )
-    db.add(therapist_message_obj)
-    db.commit()
+    # Оба сообщения хода — один executemany INSERT при commit
+    db.add_all([user_message, therapist_message_obj])
     
     # ===== ЭТАП 5: ГЕНЕРАТОР ГИПОТЕЗ (новые + обновлённые) =====
     
-    # Перезагружаем сессию чтобы получить обновлённые данные (инсайты, старые гипотезы)
-    db.refresh(session)
-    
-    # Пересобираем контекст (теперь с новым инсайтом если был)
-    context = get_therapy_context(session)
-    
-    hypothesis_input = f"""{context}
-
-Текущий ответ пользователя: {user_msg}
-
-На основе всей информации выше, проанализируй:
-1. Какие текущие гипотезы нужно обновить по confidence?
-2. Какие НОВЫЕ гипотезы возникают?
-
-Помни: твоя задача не дублировать, а ОБНОВЛЯТЬ и ГЕНЕРИРОВАТЬ."""
-    
-    gen_response_raw, _ = ask_gigachat("therapy_hypothesis_generator", hypothesis_input)
-    
     logger.info(
         "Generator responded | session_id=%s | response_len=%d",
         session_id,
@@ -285,121 +468,158 @@ async def therapy_chat(
     # Парсим ответ Генератора
     updated_hypotheses = []
     new_hypotheses = []
-    try:
-        gen_response = json.loads(gen_response_raw)
-        updated_hypotheses = gen_response.get("updated_hypotheses", [])
-        new_hypotheses = gen_response.get("new_hypotheses", [])
+    gen_response = parse_json_object(gen_response_raw)
+    if gen_response is None:
+        logger.warning("Generator returned non-JSON: %s", gen_response_raw[:100])
+    else:
+        updated_hypotheses = _hypothesis_list(gen_response, "updated_hypotheses")
+        new_hypotheses = _hypothesis_list(gen_response, "new_hypotheses")
         
         logger.info(
             "Generator parsed | updated=%d | new=%d",
             len(updated_hypotheses),
             len(new_hypotheses),
         )
-    except json.JSONDecodeError as e:
-        logger.warning("Generator returned non-JSON: %s", e)
     
     # ===== ЭТАП C: ДЕДУПЛИКАТОР (финальный список) =====
     
-    dedup_input = f"""ОБНОВЛЁННЫЕ СТАРЫЕ ГИПОТЕЗЫ:
-{json.dumps(updated_hypotheses, ensure_ascii=False, indent=2)}
+    # Сначала убираем очевидные дубли локально
+    all_hypotheses = updated_hypotheses + new_hypotheses
+    kept_hypotheses = dedup_hypotheses_locally(all_hypotheses)
+    
+    final_hypotheses = []
+    if len(kept_hypotheses) == len(all_hypotheses) and len(all_hypotheses) <= HYPOTHESIS_LOCAL_DEDUP_MAX:
+        # Дублей нет и гипотез мало — LLM дедупликатор не нужен
+        final_hypotheses = kept_hypotheses
+        
+        logger.info(
+            "Deduplicator skipped | session_id=%s | final=%d hypotheses",
+            session_id,
+            len(final_hypotheses),
+        )
+    else:
+        # В LLM уходит уже сокращённый список
+        kept_ids = {id(h) for h in kept_hypotheses}
+        updated_kept = [h for h in updated_hypotheses if id(h) in kept_ids]
+        new_kept = [h for h in new_hypotheses if id(h) in kept_ids]
+        
+        # sort_keys — одинаковые гипотезы с другим порядком ключей попадают в кэш ответов
+        dedup_input = f"""ОБНОВЛЁННЫЕ СТАРЫЕ ГИПОТЕЗЫ:
+{orjson.dumps(updated_kept, option=orjson.OPT_SORT_KEYS).decode()}
 
 НОВЫЕ ГИПОТЕЗЫ:
-{json.dumps(new_hypotheses, ensure_ascii=False, indent=2)}
+{orjson.dumps(new_kept, option=orjson.OPT_SORT_KEYS).decode()}
 
 Выполни дедупликацию и верни финальный список."""
-    
-    dedup_response_raw, _ = ask_gigachat("therapy_hypothesis_deduplicator", dedup_input)
-    
-    logger.info(
-        "Deduplicator responded | session_id=%s | response_len=%d",
-        session_id,
-        len(dedup_response_raw),
-    )
-    
-    # Парсим ответ Дедупликатора
-    final_hypotheses = []
-    try:
-        dedup_response = json.loads(dedup_response_raw)
-        final_hypotheses = dedup_response.get("hypotheses", [])
+        
+        dedup_response_raw, _ = await ask_gigachat("therapy_hypothesis_deduplicator", dedup_input)
         
         logger.info(
-            "Deduplicator parsed | final=%d hypotheses",
-            len(final_hypotheses),
+            "Deduplicator responded | session_id=%s | local_dropped=%d | response_len=%d",
+            session_id,
+            len(all_hypotheses) - len(kept_hypotheses),
+            len(dedup_response_raw),
         )
-    except json.JSONDecodeError as e:
-        logger.warning("Deduplicator returned non-JSON: %s", e)
+        
+        # Парсим ответ Дедупликатора
+        dedup_response = parse_json_object(dedup_response_raw)
+        if dedup_response is None:
+            logger.warning("Deduplicator returned non-JSON: %s", dedup_response_raw[:100])
+        else:
+            final_hypotheses = _hypothesis_list(dedup_response, "hypotheses")
+            
+            logger.info(
+                "Deduplicator parsed | final=%d hypotheses",
+                len(final_hypotheses),
+            )
     
     # ===== ЭТАП 5B: СОХРАНИТЬ ГИПОТЕЗЫ В БД =====
     
-    # Получаем текущие ID гипотез для обновления
-    existing_hyp_ids = {h.id for h in session.hypotheses}
+    # Собираем строки для пакетных UPDATE/INSERT вместо SELECT+UPDATE на каждую
+    now = utcnow()
+    hyp_updates = []
+    hyp_inserts = []
     
     for final_hyp in final_hypotheses:
         hyp_id = final_hyp.get("id")
         hyp_text = final_hyp.get("hypothesis_text", "")
         hyp_confidence = final_hyp.get("confidence", 50)
-        is_new = final_hyp.get("is_new", False)
         
         if not hyp_text:
             continue
         
         if hyp_id and hyp_id in existing_hyp_ids:
             # Обновляем существующую гипотезу
-            hyp_obj = db.query(TherapyHypothesis).filter(
-                TherapyHypothesis.id == hyp_id
-            ).first()
-            if hyp_obj:
-                hyp_obj.hypothesis_text = hyp_text
-                hyp_obj.confidence = hyp_confidence
-                hyp_obj.updated_at = datetime.now(timezone.utc)
-                
-                logger.info(
-                    "Updated hypothesis | id=%s | confidence=%d",
-                    hyp_id[:8],
-                    hyp_confidence,
-                )
+            hyp_updates.append({
+                "id": hyp_id,
+                "hypothesis_text": hyp_text,
+                "confidence": hyp_confidence,
+                "updated_at": now,
+            })
         else:
             # Создаём новую гипотезу
-            new_hyp = TherapyHypothesis(
-                id=str(uuid.uuid4()),
-                session_id=session_id,
-                hypothesis_text=hyp_text,
-                confidence=hyp_confidence,
-                is_active=True,
-            )
-            db.add(new_hyp)
-            
-            logger.info(
-                "Created new hypothesis | confidence=%d",
-                hyp_confidence,
-            )
+            hyp_inserts.append({
+                "id": token_hex(16),
+                "session_id": session_id,
+                "hypothesis_text": hyp_text,
+                "confidence": hyp_confidence,
+                "is_active": True,
+            })
+    
+    # ORM bulk UPDATE по первичному ключу / bulk INSERT (executemany)
+    if hyp_updates:
+        await db.execute(update(TherapyHypothesis), hyp_updates)
+    if hyp_inserts:
+        await db.execute(insert(TherapyHypothesis), hyp_inserts)
+    
+    logger.info(
+        "Saved hypotheses | session_id=%s | updated=%d | created=%d",
+        session_id,
+        len(hyp_updates),
+        len(hyp_inserts),
+    )
     
-    db.commit()
+    # Единственный commit: сессия, сообщения, инсайт и гипотезы
+    await db.commit()
 
 
     # ===== ЭТАП 6: СОБРАТЬ ОТВЕТ =====
     
-    # Перезагружаем сессию чтобы получить обновленные insights и hypotheses
-    db.refresh(session)
+    # Явные запросы вместо lazy-load связей (в AsyncSession lazy-load недоступен).
+    # populate_existing — bulk UPDATE гипотез не обновляет объекты в identity map.
+    response_insights = (await db.execute(
+        select(TherapyKeyInsight)
+        .where(
+            TherapyKeyInsight.session_id == session_id,
+            TherapyKeyInsight.is_deleted_by_user.is_(False),
+        )
+        .order_by(TherapyKeyInsight.display_order)
+    )).scalars().all()
+    
+    active_hypotheses = (await db.execute(
+        select(TherapyHypothesis)
+        .where(
+            TherapyHypothesis.session_id == session_id,
+            TherapyHypothesis.is_active.is_(True),
+            TherapyHypothesis.is_selected_by_user.is_(False),
+        )
+        .execution_options(populate_existing=True)
+    )).scalars().all()
     
+    # Строки из БД уже нужных типов — собираем схемы через model_construct без
+    # повторной валидации, итоговый ответ FastAPI проверяет по response_model
     active_insights = [
-        TherapyKeyInsightSchema(
+        TherapyKeyInsightSchema.model_construct(
             id=i.id,
             insight_summary=i.insight_summary or "Ключевое знание",  # Дефолт если None
             confidence=i.confidence if i.confidence is not None else 0,  # Дефолт если None
             importance=i.importance if i.importance is not None else 0,  # Дефолт если None
         )
-        for i in session.key_insights
-        if not i.is_deleted_by_user
-    ]
-    
-    active_hypotheses = [
-        h for h in session.hypotheses
-        if h.is_active and not h.is_selected_by_user
+        for i in response_insights
     ]
     
     hypotheses_for_response = [
-        TherapyHypothesisSchema(
+        TherapyHypothesisSchema.model_construct(
             id=h.id,
             hypothesis_text=h.hypothesis_text,
             confidence=h.confidence,
@@ -411,7 +631,7 @@ async def therapy_chat(
     # Проверяем есть ли гипотезы готовые к Board
     ready_for_board = any(h.is_ready_for_board for h in hypotheses_for_response)
     
-    response = TherapyResponse(
+    response = TherapyResponse.model_construct(
         session_id=session_id,
         therapist_message=therapist_message,
         key_insights=active_insights,
@@ -427,6 +647,8 @@ async def therapy_chat(
         len(hypotheses_for_response),
     )
     
+    if idempotency_key:
+        cache_therapy_retry(user_id, idempotency_key, user_msg, response)
     return response
 
 
@@ -436,7 +658,7 @@ async def delete_therapy_insight(
     insight_id: str,
     request: Request,
     user_id: str = Depends(verify_token),
-    db = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Удалить инсайт (отметить как удалённый пользователем).
@@ -444,38 +666,29 @@ async def delete_therapy_insight(
     Терапевт будет видеть удалённые инсайты в контексте и понимать что это чувствительные темы.
     """
     
-    # Находим инсайт
-    insight = db.query(TherapyKeyInsight).filter(
-        TherapyKeyInsight.id == insight_id
-    ).first()
-    
-    if not insight:
-        logger.warning("Insight not found: %s", insight_id)
-        return {"status": "not_found", "message": "Инсайт не найден"}
-    
-    # Проверяем что инсайт принадлежит сессии текущего пользователя
-    session = db.query(TherapySession).filter(
-        TherapySession.id == insight.session_id,
-        TherapySession.user_id == user_id,
-    ).first()
-    
-    if not session:
-        logger.warning(
-            "Insight %s doesn't belong to user %s",
-            insight_id,
-            user_id,
+    # Одним UPDATE: инсайт должен принадлежать сессии текущего пользователя
+    user_sessions = select(TherapySession.id).where(TherapySession.user_id == user_id)
+    result = await db.execute(
+        update(TherapyKeyInsight)
+        .where(
+            TherapyKeyInsight.id == insight_id,
+            TherapyKeyInsight.session_id.in_(user_sessions),
         )
-        return {"status": "forbidden", "message": "Доступ запрещён"}
+        .values(is_deleted_by_user=True, deleted_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    updated = result.rowcount
     
-    # Отмечаем как удалённый
-    insight.is_deleted_by_user = True
-    insight.deleted_at = datetime.now(timezone.utc)
-    db.commit()
+    if not updated:
+        # Чужой инсайт не отличаем от несуществующего
+        logger.warning("Insight %s not found for user %s", insight_id, user_id)
+        return {"status": "not_found", "message": "Инсайт не найден"}
     
     logger.info(
-        "Insight marked as deleted | insight_id=%s | session_id=%s",
+        "Insight marked as deleted | insight_id=%s | user=%s",
         insight_id[:8],
-        insight.session_id[:8],
+        user_id,
     )
     
     return {
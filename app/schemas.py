@@ -69,7 +69,7 @@ class LoginRequest(BaseModel):
     )
 
 
-# ===== AUTHENTICATION (из auth.py) =====
+# ===== AUTHENTICATION (app/auth.py) =====
 
 class TokenResponse(BaseModel):
     """Ответ при логине — оба токена."""
@@ -122,3 +122,36 @@ class ChatResponseV2(BaseModel):
     agents: List[AgentReplyV2]
     user_message_compressed: Optional[dict] = None
     debug: bool = False
+
+
+# ===== THERAPY =====
+
+class TherapyKeyInsightSchema(BaseModel):
+    """Ключевое знание для ответа."""
+    id: str
+    insight_summary: str
+    confidence: int
+    importance: int
+
+
+class TherapyHypothesisSchema(BaseModel):
+    """Гипотеза для ответа."""
+    id: str
+    hypothesis_text: str
+    confidence: int
+    is_ready_for_board: bool
+
+
+class TherapyRequest(BaseModel):
+    """Запрос к Терапевту."""
+    session_id: Optional[str] = None  # None если новая сессия
+    message: str
+
+
+class TherapyResponse(BaseModel):
+    """Ответ от Терапевта."""
+    session_id: str
+    therapist_message: str
+    key_insights: List[TherapyKeyInsightSchema]
+    hypotheses: List[TherapyHypothesisSchema]
+    ready_for_board: bool
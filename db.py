@@ -1,10 +1,15 @@
 import os
-import json
+import time
+import orjson
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Float, Boolean, Text, ForeignKey
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import Column, String, DateTime, Integer, Float, Boolean, Text, ForeignKey, Index, JSON, update
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.dialects.postgresql import JSONB, insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
 # Загружаем .env файл
 load_dotenv()
@@ -14,23 +19,98 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL не установлена в .env файле!")
 
-engine = create_engine(DATABASE_URL, future=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Пул соединений к серверной БД (на каждый uvicorn-воркер).
+# pool_size + max_overflow на все воркеры должно укладываться в max_connections сервера.
+DB_POOL_SIZE = 20
+DB_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 30     # секунды ожидания свободного соединения
+DB_POOL_RECYCLE = 1800   # секунды: переоткрываем соединения раньше серверного idle-таймаута
+
+
+def _engine_kwargs(url: str) -> dict:
+    """
+    Параметры пула: только для серверных БД, у SQLite свой пул по умолчанию.
+
+    pool_pre_ping проверяет соединение перед выдачей — первый запрос после
+    простоя не падает на соединении, закрытом сервером.
+    """
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _json_dumps(value) -> str:
+    """orjson для JSON-колонок: драйверы ждут str, orjson отдаёт bytes."""
+    return orjson.dumps(value).decode()
+
+
+# ===== АСИНХРОННЫЙ ДВИЖОК =====
+
+# Драйвер из DATABASE_URL -> асинхронный для той же БД
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """
+    Переводит DATABASE_URL на асинхронный драйвер
+    (sqlite -> aiosqlite, postgresql -> asyncpg). Уже асинхронный URL не меняется.
+    """
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+# Запросы к БД не блокируют event loop, пока идут вызовы GigaChat
+async_engine = create_async_engine(
+    get_async_database_url(DATABASE_URL),
+    future=True,
+    # JSON-колонки кодируются orjson (в C) вместо стандартного json
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
+    **_engine_kwargs(DATABASE_URL),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
 Base = declarative_base()
 
 
+def utcnow() -> datetime:
+    """
+    Текущее время UTC без tzinfo — для всех DateTime колонок.
+
+    Колонки объявлены как DateTime (timestamp without time zone): asyncpg
+    не принимает aware datetime для такой колонки, поэтому все записи
+    идут через этот хелпер.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# JSON-поля: JSONB на PostgreSQL (бинарный, индексируемый), JSON (TEXT) на SQLite.
+# Значения читаются и пишутся как dict/list, без json.loads/dumps в коде.
+JsonColumn = JSON().with_variant(JSONB(), "postgresql")
+
+
 # ===== СУЩЕСТВУЮЩИЕ МОДЕЛИ =====
 
 class User(Base):
     __tablename__ = "users"
 
     id = Column(String, primary_key=True, index=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    last_seen_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+    last_seen_at = Column(DateTime, default=utcnow)
 
     # Связь с сессиями терапии
-    therapy_sessions = relationship("TherapySession", back_populates="user")
+    therapy_sessions = relationship("TherapySession", back_populates="user", lazy="raise")
 
 
 # ===== НОВЫЕ МОДЕЛИ ДЛЯ ТЕРАПЕВТА =====
@@ -40,24 +120,31 @@ class TherapySession(Base):
     __tablename__ = "therapy_sessions"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)  # индекс — составной, см. __table_args__
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
     
     # Исходная проблема (первое сообщение пользователя)
     initial_problem = Column(Text, nullable=False)
     
     # Статус сессии: ongoing, ready_for_board, archived
-    status = Column(String, default="ongoing", index=True)
+    status = Column(String, default="ongoing")
     
     # Финальная гипотеза (когда пользователь выбрал и отправил на Board)
     final_hypothesis_id = Column(String, ForeignKey("therapy_hypotheses.id"), nullable=True)
     
-    # Связи
+    # Связи. Коллекции не грузятся неявно (lazy="raise"): в AsyncSession lazy-load
+    # недоступен, а на списке сессий дал бы N+1. Нужна коллекция — явный
+    # .options(selectinload(TherapySession.messages)) в запросе или отдельный SELECT.
     user = relationship("User", back_populates="therapy_sessions")
-    messages = relationship("TherapyMessage", back_populates="session", cascade="all, delete-orphan")
-    key_insights = relationship("TherapyKeyInsight", back_populates="session", cascade="all, delete-orphan")
-    hypotheses = relationship("TherapyHypothesis", foreign_keys="[TherapyHypothesis.session_id]", back_populates="session", cascade="all, delete-orphan")
+    messages = relationship("TherapyMessage", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    key_insights = relationship("TherapyKeyInsight", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    hypotheses = relationship("TherapyHypothesis", foreign_keys="[TherapyHypothesis.session_id]", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+
+    # Сессии пользователя (проверка владельца, выборка по статусу)
+    __table_args__ = (
+        Index("ix_therapy_sessions_user_status", "user_id", "status"),
+    )
 
 
 class TherapyMessage(Base):
@@ -65,7 +152,7 @@ class TherapyMessage(Base):
     __tablename__ = "therapy_messages"
 
     id = Column(String, primary_key=True, index=True)
-    session_id = Column(String, ForeignKey("therapy_sessions.id"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("therapy_sessions.id"), nullable=False)  # индекс — составной, см. __table_args__
     
     # role: "user" или "therapist"
     role = Column(String, nullable=False)
@@ -74,20 +161,26 @@ class TherapyMessage(Base):
     content = Column(Text, nullable=False)
     
     # Метаданные (опционально: usage токенов, latency и т.д.)
-    message_metadata = Column(Text, default="{}")  # JSON как строка
+    message_metadata = Column(JsonColumn, default=dict)
     
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    created_at = Column(DateTime, default=utcnow, index=True)
     
     # Связь
     session = relationship("TherapySession", back_populates="messages")
 
+    # Последние N сообщений сессии: ORDER BY created_at DESC LIMIT N
+    # (B-tree читается в обратном порядке, DESC в индексе не нужен)
+    __table_args__ = (
+        Index("ix_therapy_messages_session_created", "session_id", "created_at"),
+    )
+
 
 class TherapyKeyInsight(Base):
     """Ключевые знания, извлечённые из диалога (Q&A пользователя)."""
     __tablename__ = "therapy_key_insights"
 
     id = Column(String, primary_key=True, index=True)
-    session_id = Column(String, ForeignKey("therapy_sessions.id"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("therapy_sessions.id"), nullable=False)  # индекс — составной, см. __table_args__
     
     # Вопрос Терапевта и ответ пользователя
     question = Column(Text, nullable=False)
@@ -111,24 +204,29 @@ class TherapyKeyInsight(Base):
     # Когда был удалён
     deleted_at = Column(DateTime, nullable=True)
     
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    created_at = Column(DateTime, default=utcnow, index=True)
     
     # Связь
     session = relationship("TherapySession", back_populates="key_insights")
 
+    # Контекст Терапевта: активные/удалённые инсайты сессии в порядке появления
+    __table_args__ = (
+        Index("ix_key_insights_session_deleted_order", "session_id", "is_deleted_by_user", "display_order"),
+    )
+
 
 class TherapyHypothesis(Base):
     """Гипотезы, которые генерирует Терапевт."""
     __tablename__ = "therapy_hypotheses"
 
     id = Column(String, primary_key=True, index=True)
-    session_id = Column(String, ForeignKey("therapy_sessions.id"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("therapy_sessions.id"), nullable=False)  # индекс — составной, см. __table_args__
     
     # Гипотеза в человекочитаемом формате
     hypothesis_text = Column(Text, nullable=False)
     
     # Гипотеза в JSON формате (для отправки на Board)
-    hypothesis_json = Column(Text, nullable=True)  # JSON как строка
+    hypothesis_json = Column(JsonColumn, nullable=True)
     
     # Уверенность Терапевта в этой гипотезе (0-100)
     confidence = Column(Integer, default=50)
@@ -139,48 +237,101 @@ class TherapyHypothesis(Base):
     # Выбрал ли пользователь эту гипотезу для отправки на Board
     is_selected_by_user = Column(Boolean, default=False)
     
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow, index=True)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
     
     # Связь
     session = relationship("TherapySession", back_populates="hypotheses", foreign_keys="[TherapyHypothesis.session_id]")
 
+    # Контекст Терапевта: топ активных гипотез сессии по confidence
+    __table_args__ = (
+        Index("ix_hypotheses_session_active_selected_confidence", "session_id", "is_active", "is_selected_by_user", "confidence"),
+    )
+
 
 # ===== ИНИЦИАЛИЗАЦИЯ БД =====
 
-def init_db() -> None:
+async def init_db() -> None:
     """
     Создаёт все таблицы, описанные в моделях.
     Если таблица уже существует — ничего не делает.
     """
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def close_db() -> None:
+    """Закрывает соединения пула (при остановке приложения)."""
+    await async_engine.dispose()
 
 
 # ===== ЗАВИСИМОСТЬ ДЛЯ FASTAPI =====
 
-def get_db():
-    """Выдаёт сессию БД для FastAPI dependency injection."""
-    db = SessionLocal()
-    try:
+async def get_db():
+    """Выдаёт асинхронную сессию БД для FastAPI dependency injection."""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # ===== УТИЛИТЫ ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЕМ =====
 
-def create_user_if_not_exists(db, user_id: str) -> None:
+# INSERT ... ON CONFLICT DO UPDATE для диалекта БД (None — диалект без upsert)
+_UPSERT_INSERTS = {
+    "postgresql": postgresql_insert,
+    "sqlite": sqlite_insert,
+}
+_upsert_insert = _UPSERT_INSERTS.get(async_engine.dialect.name)
+
+# last_seen_at пишем не чаще раза в LAST_SEEN_DEBOUNCE секунд на пользователя
+LAST_SEEN_DEBOUNCE = 60
+LAST_SEEN_CACHE_MAX_ITEMS = 10_000
+
+# user_id -> time.monotonic() последней записи (пользователь точно есть в БД)
+_last_seen_written: "OrderedDict[str, float]" = OrderedDict()
+
+
+def _seen_recently(user_id: str) -> bool:
+    """True, если last_seen_at пользователя писали меньше LAST_SEEN_DEBOUNCE секунд назад."""
+    written_at = _last_seen_written.get(user_id)
+    return written_at is not None and time.monotonic() - written_at < LAST_SEEN_DEBOUNCE
+
+
+def _mark_seen(user_id: str) -> None:
+    """Запоминает момент записи last_seen_at (самые старые записи вытесняются)."""
+    _last_seen_written[user_id] = time.monotonic()
+    _last_seen_written.move_to_end(user_id)
+    if len(_last_seen_written) > LAST_SEEN_CACHE_MAX_ITEMS:
+        _last_seen_written.popitem(last=False)
+
+
+async def create_user_if_not_exists(db: AsyncSession, user_id: str) -> None:
     """
     Если пользователя с таким id нет — создаём.
     Если есть — обновляем last_seen_at.
-    """
-    user = db.get(User, user_id)
-    now = datetime.now(timezone.utc)
 
-    if user is None:
-        user = User(id=user_id, created_at=now, last_seen_at=now)
-        db.add(user)
+    На PostgreSQL и SQLite — одним UPSERT без предварительного SELECT.
+    Повторный вход в течение LAST_SEEN_DEBOUNCE секунд БД не трогает:
+    пользователь уже создан, а last_seen_at отстаёт не больше чем на минуту.
+    """
+    if _seen_recently(user_id):
+        return
+
+    now = utcnow()
+
+    if _upsert_insert is not None:
+        stmt = _upsert_insert(User).values(id=user_id, created_at=now, last_seen_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.id],
+            set_={"last_seen_at": now},
+        )
+        await db.execute(stmt)
     else:
-        user.last_seen_at = now
-
-    db.commit()
+        # Без UPSERT: UPDATE без загрузки объекта, INSERT — только если строки нет
+        result = await db.execute(
+            update(User).where(User.id == user_id).values(last_seen_at=now)
+        )
+        if not result.rowcount:
+            db.add(User(id=user_id, created_at=now, last_seen_at=now))
+
+    await db.commit()
+    _mark_seen(user_id)
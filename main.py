@@ -5,24 +5,48 @@ Board.AI — Clarity Feedback Loop для менеджеров AI-native ком
 Собирает все модули в единое целое.
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
 
 from app.core.config import CORS_ORIGINS
 from app.core.logger import logger
+from app.core.rate_limit import limiter
+from app.llm import start_http_client, close_http_client
 from app.routes import auth_router, agent_router, board_router, therapy_router
-from db import init_db
+from db import init_db, close_db
+
+# ===== ЖИЗНЕННЫЙ ЦИКЛ (БД + HTTP КЛИЕНТ) =====
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Инициализация при запуске и cleanup при остановке приложения."""
+    logger.info("Starting up Board.AI application")
+    await init_db()
+    logger.info("Database initialized")
+    # Клиент один на процесс; роуты могут взять его как request.app.state.http
+    app.state.http = await start_http_client()
+
+    yield
+
+    logger.info("Shutting down Board.AI application")
+    await close_http_client()
+    await close_db()
+
 
 # ===== ИНИЦИАЛИЗАЦИЯ ПРИЛОЖЕНИЯ =====
 
-limiter = Limiter(key_func=get_remote_address)
 app = FastAPI(
     title="Board.AI",
     description="Clarity Feedback Loop — когнитивный протез для менеджеров",
     version="1.0.0",
+    lifespan=lifespan,
+    # Ответы сериализуются orjson (в C), а не стандартным json
+    default_response_class=ORJSONResponse,
 )
 
 # ===== MIDDLEWARE =====
@@ -37,25 +61,9 @@ app.add_middleware(
     allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["POST"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "Idempotency-Key"],
 )
 
-# ===== ИНИЦИАЛИЗАЦИЯ БД =====
-
-@app.on_event("startup")
-def on_startup():
-    """Инициализация при запуске приложения."""
-    logger.info("Starting up Board.AI application")
-    init_db()
-    logger.info("Database initialized")
-
-
-@app.on_event("shutdown")
-def on_shutdown():
-    """Cleanup при остановке приложения."""
-    logger.info("Shutting down Board.AI application")
-
-
 # ===== РЕГИСТРАЦИЯ ROUTERS =====
 
 app.include_router(auth_router)
@@ -63,7 +71,10 @@ app.include_router(agent_router)
 app.include_router(board_router)
 app.include_router(therapy_router)
 
-logger.info("All routers registered | routes: /api/login, /api/refresh, /api/board, /api/agent, /api/summary")
+logger.info(
+    "All routers registered | routes: %s",
+    ", ".join(route.path for route in app.routes if route.path.startswith("/api/")),
+)
 
 
 # ===== HEALTH CHECK =====
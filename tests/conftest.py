@@ -0,0 +1,31 @@
+"""
+Общая настройка pytest.
+
+app.core.config и db.py читают переменные окружения при импорте,
+поэтому тестовые значения задаются до импорта модулей приложения.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("GIGACHAT_AUTH_KEY", "test-auth-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+# Файловая SQLite во временной папке: in-memory база у каждого соединения своя
+_DB_DIR = tempfile.mkdtemp(prefix="board-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB_DIR}/test.db")
+
+
+@pytest.fixture(autouse=True)
+def _reset_rate_limits():
+    """Счётчики slowapi общие для процесса — каждый тест начинает с нуля."""
+    from app.core.rate_limit import limiter
+
+    limiter.reset()
+    yield
@@ -0,0 +1,91 @@
+"""Тесты совета директоров: /api/board и поток NDJSON /api/board/stream."""
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import cache
+from app.routes import board
+from app.schemas import CompressedMessage
+
+AGENTS = ["ceo", "cfo", "cpo", "marketing", "skeptic"]
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    cache.clear_all_caches()
+    yield
+    cache.clear_all_caches()
+
+
+@pytest.fixture
+def gigachat(monkeypatch):
+    """Агенты отвечают вердиктом, expander — текстом; failing — агенты с ошибкой."""
+    failing = set()
+
+    async def fake_compress(message, user_id="anonymous"):
+        return CompressedMessage(intent="idea", domain="product", idea_summary=message)
+
+    async def fake_ask(agent, user_msg, track_usage=False, **kwargs):
+        if agent in failing:
+            raise RuntimeError(f"{agent} недоступен")
+        return orjson.dumps({"verdict": "GO", "confidence": 70}).decode(), {}
+
+    async def fake_expand(agent, compressed, track_usage=False):
+        return f"Мнение {agent}", {}
+
+    monkeypatch.setattr(board, "compress_user_message", fake_compress)
+    monkeypatch.setattr(board, "ask_gigachat", fake_ask)
+    monkeypatch.setattr(board, "expand_agent_output", fake_expand)
+    return failing
+
+
+@pytest.fixture
+def api(gigachat):
+    with TestClient(main.app) as test_client:
+        token = test_client.post("/api/login", json={"user_id": "board-user"}).json()["access_token"]
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        yield test_client
+
+
+def _stream_lines(api, payload):
+    resp = api.post("/api/board/stream", json=payload)
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    return [orjson.loads(line) for line in resp.text.splitlines()]
+
+
+def test_stream_emits_every_agent_then_summary_then_done(api):
+    lines = _stream_lines(api, {"message": "Запускаем сервис доставки?"})
+
+    replies, done = lines[:-1], lines[-1]
+    assert sorted(r["agent"] for r in replies[:-1]) == sorted(AGENTS)
+    assert replies[-1]["agent"] == "summary"
+    assert all(r["text"] == f"Мнение {r['agent']}" for r in replies)
+    assert done == {"done": True, "user_message_compressed": None, "debug": False}
+
+
+def test_stream_respects_active_agents_and_followup_mode(api):
+    lines = _stream_lines(api, {"message": "А что с бюджетом?", "active_agents": ["cfo"], "mode": "followup"})
+
+    assert [line.get("agent") for line in lines] == ["cfo", None]
+    assert lines[-1]["done"] is True
+
+
+def test_stream_failed_agent_does_not_abort_board(api, gigachat):
+    gigachat.add("cpo")
+
+    lines = _stream_lines(api, {"message": "Запускаем сервис доставки?"})
+
+    by_agent = {line["agent"]: line["text"] for line in lines[:-1]}
+    assert by_agent["cpo"].startswith("Ошибка при обращении к GigaChat")
+    assert by_agent["ceo"] == "Мнение ceo"
+    assert "summary" in by_agent
+
+
+def test_board_returns_replies_in_agent_order(api):
+    resp = api.post("/api/board", json={"message": "Запускаем сервис доставки?"})
+
+    assert resp.status_code == 200, resp.text
+    assert [r["agent"] for r in resp.json()["agents"]] == AGENTS + ["summary"]
@@ -0,0 +1,175 @@
+"""Тесты in-memory кэшей (app/cache.py)."""
+
+import pytest
+
+from app import cache
+from app.schemas import ParsedRequest, CompressedMessage
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    cache.clear_all_caches()
+    yield
+    cache.clear_all_caches()
+
+
+def _parsed(message: str) -> ParsedRequest:
+    return ParsedRequest(original_message=message, intent="idea", domain="product")
+
+
+# ===== КЭШ ПО НОРМАЛИЗОВАННОМУ ТЕКСТУ =====
+
+def test_content_cache_matches_case_and_whitespace_variants():
+    compressed = CompressedMessage(intent="idea", domain="product")
+    cache.cache_compressed("alice", "Стоит ли  запускать продукт?", compressed)
+
+    assert cache.get_cached_compressed("bob", "стоит ли запускать продукт?") is compressed
+    assert cache.get_cached_compressed("bob", "стоит ли запускать сервис?") is None
+
+
+def test_content_parse_hit_does_not_leak_other_users_text():
+    cache.cache_parse("alice", "Стоит ли  Запускать?", _parsed("Стоит ли  Запускать?"))
+
+    hit = cache.get_cached_parse("bob", "стоит ли запускать?")
+
+    assert hit is not None
+    assert hit.original_message == "стоит ли запускать?"
+    # Запись в кэше не изменилась
+    assert cache.get_cached_parse("alice", "Стоит ли  Запускать?").original_message == "Стоит ли  Запускать?"
+
+
+def test_user_parse_hit_returns_cached_object():
+    parsed = _parsed("вопрос")
+    cache.cache_parse("alice", "вопрос", parsed)
+
+    assert cache.get_cached_parse("alice", "вопрос") is parsed
+
+
+# ===== КЛЮЧИ И ШАРДИРОВАННЫЙ LRU =====
+
+def test_cache_key_is_plain_tuple():
+    assert cache.get_cache_key("alice", "привет") == ("alice", "привет")
+    assert cache.get_cache_key("alice", "привет") != cache.get_cache_key("bob", "привет")
+
+
+def test_sharded_lru_get_put():
+    lru = cache._ShardedLRU(max_items=64, cleanup_size=32)
+
+    assert lru.get("missing") is None
+    assert lru.put("a", 1) is None
+    assert lru.get("a") == 1
+
+    lru.put("a", 2)
+    assert lru.get("a") == 2
+
+    lru.clear()
+    assert lru.get("a") is None
+
+
+def test_sharded_lru_evicts_oldest_in_shard(monkeypatch):
+    # Один шард — порядок вытеснения детерминирован
+    monkeypatch.setattr(cache._ShardedLRU, "_shard_index", staticmethod(lambda key: 0))
+    lru = cache._ShardedLRU(max_items=3 * cache.CACHE_SHARDS, cleanup_size=2 * cache.CACHE_SHARDS)
+
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.put("c", 3)
+    lru.get("a")  # "a" теперь самый свежий
+
+    cleaned = lru.put("d", 4)
+
+    assert cleaned == (0, 2)
+    assert lru.get("b") is None
+    assert lru.get("c") is None
+    assert lru.get("a") == 1
+    assert lru.get("d") == 4
+
+
+# ===== TTL =====
+
+class _Clock:
+    """Подменяет time.monotonic в app.cache."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_response_cache_hit_until_ttl(clock):
+    cache.cache_response("ceo", "вход агента", "ответ", {"tokens_total": 10})
+
+    assert cache.get_cached_response("ceo", "вход агента") == ("ответ", {"tokens_total": 10})
+    # Ключ — агент + вход: другой агент или другой вход не попадают
+    assert cache.get_cached_response("cfo", "вход агента") is None
+    assert cache.get_cached_response("ceo", "другой вход") is None
+
+    clock.now += cache.RESPONSE_CACHE_TTL - 1
+    assert cache.get_cached_response("ceo", "вход агента") is not None
+
+    clock.now += 1
+    assert cache.get_cached_response("ceo", "вход агента") is None
+
+
+def test_response_cache_returns_usage_copy(clock):
+    cache.cache_response("ceo", "вход", "ответ", {"tokens_total": 10})
+
+    _, usage = cache.get_cached_response("ceo", "вход")
+    usage["tokens_total"] = 0
+
+    assert cache.get_cached_response("ceo", "вход")[1] == {"tokens_total": 10}
+
+
+def test_response_key_uses_digest():
+    agent, digest = cache.get_response_key("ceo", "x" * 10_000)
+
+    assert agent == "ceo"
+    assert len(digest) == 32
+
+
+# ===== IDEMPOTENCY-KEY =====
+
+def test_idempotent_compressed_requires_same_key_and_message(clock):
+    compressed = CompressedMessage(intent="idea", domain="product")
+    cache.cache_idempotent_compressed("alice", "key-1", "сообщение", compressed)
+
+    assert cache.get_idempotent_compressed("alice", "key-1", "сообщение") is compressed
+    # Тот же ключ с другим текстом, чужой пользователь или другой ключ — промах
+    assert cache.get_idempotent_compressed("alice", "key-1", "другое сообщение") is None
+    assert cache.get_idempotent_compressed("bob", "key-1", "сообщение") is None
+    assert cache.get_idempotent_compressed("alice", "key-2", "сообщение") is None
+
+
+def test_idempotent_compressed_expires(clock):
+    compressed = CompressedMessage(intent="idea", domain="product")
+    cache.cache_idempotent_compressed("alice", "key-1", "сообщение", compressed)
+
+    clock.now += cache.IDEMPOTENCY_CACHE_TTL
+    assert cache.get_idempotent_compressed("alice", "key-1", "сообщение") is None
+
+
+# ===== КЭШ ГЕНЕРАТОРА ГИПОТЕЗ =====
+
+def test_similar_hypotheses_hit_for_same_state_and_tail(clock):
+    cache.cache_similar_hypotheses("s1", ["h2", "i1"], "хвост", "Да, боюсь провала", "ответ")
+
+    # Порядок id не важен, сообщение сравнивается с учётом регистра и пробелов
+    assert cache.get_similar_hypotheses("s1", ["i1", "h2"], "хвост", "да,  боюсь провала") == "ответ"
+    assert cache.get_similar_hypotheses("s2", ["i1", "h2"], "хвост", "Да, боюсь провала") is None
+    assert cache.get_similar_hypotheses("s1", ["i1"], "хвост", "Да, боюсь провала") is None
+
+
+def test_similar_hypotheses_miss_when_conversation_tail_changes(clock):
+    # Одно и то же «да» в ответ на разные вопросы Терапевта — разные ходы
+    cache.cache_similar_hypotheses("s1", ["i1"], "Терапевт: Вам страшно?", "да", "ответ")
+
+    assert cache.get_similar_hypotheses("s1", ["i1"], "Терапевт: Вам скучно?", "да") is None
+    assert cache.get_similar_hypotheses("s1", ["i1"], "Терапевт: Вам страшно?", "да") == "ответ"
@@ -0,0 +1,108 @@
+"""Тесты кэша и дедупликации запросов в ask_gigachat (app/llm/client.py)."""
+
+import asyncio
+
+import pytest
+
+from app import cache
+from app.llm import client
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    cache.clear_all_caches()
+    client._inflight_requests.clear()
+    yield
+    cache.clear_all_caches()
+    client._inflight_requests.clear()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Подменяет HTTP запрос агента: считает вызовы и ждёт release."""
+
+    class Upstream:
+        def __init__(self) -> None:
+            self.calls = []
+            self.release = asyncio.Event()
+
+        async def request(self, agent, user_msg, track_usage, cache_session=None):
+            self.calls.append((agent, user_msg))
+            await self.release.wait()
+            return f"ответ {agent}", {"tokens_total": 5}
+
+    fake = Upstream()
+    monkeypatch.setattr(client, "_request_agent", fake.request)
+    return fake
+
+
+def test_identical_concurrent_requests_share_one_call(upstream):
+    async def scenario():
+        upstream.release = asyncio.Event()
+        waiters = [asyncio.create_task(client.ask_gigachat("ceo", "вход")) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(scenario())
+
+    assert upstream.calls == [("ceo", "вход")]
+    assert all(text == "ответ ceo" for text, _ in results)
+    assert client._inflight_requests == {}
+
+
+def test_different_agents_are_not_coalesced(upstream):
+    async def scenario():
+        upstream.release = asyncio.Event()
+        upstream.release.set()
+        await asyncio.gather(client.ask_gigachat("ceo", "вход"), client.ask_gigachat("cfo", "вход"))
+
+    asyncio.run(scenario())
+
+    assert sorted(upstream.calls) == [("ceo", "вход"), ("cfo", "вход")]
+
+
+def test_completed_request_is_served_from_cache(upstream):
+    async def scenario():
+        upstream.release = asyncio.Event()
+        upstream.release.set()
+        await client.ask_gigachat("ceo", "вход")
+        return await client.ask_gigachat("ceo", "вход")
+
+    text, usage = asyncio.run(scenario())
+
+    assert text == "ответ ceo"
+    assert usage == {"tokens_total": 5}
+    assert len(upstream.calls) == 1
+
+
+def test_cancelled_waiter_does_not_cancel_shared_request(upstream):
+    async def scenario():
+        upstream.release = asyncio.Event()
+        first = asyncio.create_task(client.ask_gigachat("ceo", "вход"))
+        second = asyncio.create_task(client.ask_gigachat("ceo", "вход"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await second, first.cancelled()
+
+    (text, _), first_cancelled = asyncio.run(scenario())
+
+    assert first_cancelled
+    assert text == "ответ ceo"
+    assert len(upstream.calls) == 1
+
+
+def test_use_cache_false_bypasses_coalescing(upstream):
+    async def scenario():
+        upstream.release = asyncio.Event()
+        upstream.release.set()
+        await asyncio.gather(
+            client.ask_gigachat("ceo", "вход", use_cache=False),
+            client.ask_gigachat("ceo", "вход", use_cache=False),
+        )
+
+    asyncio.run(scenario())
+
+    assert len(upstream.calls) == 2
@@ -0,0 +1,91 @@
+"""Тесты create_user_if_not_exists: UPSERT и debounce last_seen_at (db.py)."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import db
+
+
+class _Clock:
+    """Подменяет time.monotonic в db."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(db, "time", fake)
+    monkeypatch.setattr(db, "_last_seen_written", db.OrderedDict())
+    return fake
+
+
+@pytest.fixture
+def wall(monkeypatch):
+    """Подменяет utcnow: тест сам двигает «настенное» время записи."""
+    state = {"now": datetime(2026, 1, 1, 12, 0, 0)}
+    monkeypatch.setattr(db, "utcnow", lambda: state["now"])
+    return state
+
+
+async def _login(user_id: str) -> None:
+    async with db.AsyncSessionLocal() as session:
+        await db.create_user_if_not_exists(session, user_id)
+
+
+async def _user(user_id: str):
+    async with db.AsyncSessionLocal() as session:
+        return await session.get(db.User, user_id)
+
+
+def _run(scenario):
+    async def wrapped():
+        await db.init_db()
+        try:
+            return await scenario()
+        finally:
+            # Соединения пула привязаны к циклу событий этого asyncio.run
+            await db.async_engine.dispose()
+    return asyncio.run(wrapped())
+
+
+@pytest.mark.parametrize("use_upsert", [True, False], ids=["upsert", "update-insert"])
+def test_login_creates_then_debounces_then_updates(monkeypatch, clock, wall, use_upsert):
+    if not use_upsert:
+        monkeypatch.setattr(db, "_upsert_insert", None)
+    user_id = f"user-{use_upsert}"
+
+    async def scenario():
+        await _login(user_id)
+        created = await _user(user_id)
+
+        # Повторный вход внутри окна debounce — БД не трогаем
+        clock.now += db.LAST_SEEN_DEBOUNCE - 1
+        wall["now"] = datetime(2026, 1, 1, 12, 0, 59)
+        await _login(user_id)
+        debounced = await _user(user_id)
+
+        # После окна — last_seen_at обновляется, created_at прежний
+        clock.now += 1
+        wall["now"] = datetime(2026, 1, 1, 12, 1, 0)
+        await _login(user_id)
+        updated = await _user(user_id)
+        return created, debounced, updated
+
+    created, debounced, updated = _run(scenario)
+
+    assert created.created_at == created.last_seen_at == datetime(2026, 1, 1, 12, 0, 0)
+    assert debounced.last_seen_at == datetime(2026, 1, 1, 12, 0, 0)
+    assert updated.created_at == datetime(2026, 1, 1, 12, 0, 0)
+    assert updated.last_seen_at == datetime(2026, 1, 1, 12, 1, 0)
+
+
+def test_utcnow_is_naive_utc():
+    # DateTime колонки — timestamp without time zone (asyncpg не примет aware)
+    assert db.utcnow().tzinfo is None
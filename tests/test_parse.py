@@ -0,0 +1,55 @@
+"""Тесты разбора JSON-ответов моделей (app/llm/parse.py)."""
+
+from app.llm.parse import parse_json_object, parse_agent_json
+
+
+def test_parse_json_object_plain_object():
+    assert parse_json_object('{"verdict": "GO", "confidence": 80}') == {"verdict": "GO", "confidence": 80}
+
+
+def test_parse_json_object_rejects_non_json():
+    assert parse_json_object("Извините, я не могу ответить") is None
+    assert parse_json_object("") is None
+
+
+def test_parse_json_object_rejects_non_object_json():
+    assert parse_json_object('["a", "b"]') is None
+    assert parse_json_object('"строка"') is None
+    assert parse_json_object("42") is None
+
+
+def test_parse_json_object_strips_json_code_fence():
+    raw = '```json\n{"question": "Что вы чувствуете?"}\n```'
+    assert parse_json_object(raw) == {"question": "Что вы чувствуете?"}
+
+
+def test_parse_json_object_strips_bare_code_fence_with_whitespace():
+    raw = '\n  ```\n{"a": 1}\n```  \n'
+    assert parse_json_object(raw) == {"a": 1}
+
+
+def test_parse_json_object_fenced_non_object_is_rejected():
+    assert parse_json_object("```json\n[1, 2]\n```") is None
+    assert parse_json_object("```json\nне json\n```") is None
+    assert parse_json_object("``````") is None
+
+
+def test_parse_agent_json_valid():
+    parsed, ok = parse_agent_json('{"verdict": "GO", "confidence": 70}', "ceo")
+    assert ok
+    assert parsed == {"verdict": "GO", "confidence": 70}
+
+
+def test_parse_agent_json_non_json_falls_back():
+    parsed, ok = parse_agent_json("not json", "ceo")
+    assert not ok
+    assert parsed["verdict"] == "NO-DATA"
+    assert parsed["raw_response"] == "not json"
+
+
+def test_parse_agent_json_missing_fields_is_incomplete():
+    parsed, ok = parse_agent_json('{"verdict": "GO"}', "cfo", keep_raw_if_incomplete=True)
+    assert not ok
+    assert parsed["verdict"] == "GO"
+    assert parsed["confidence"] == 0
+    assert parsed["raw_response"] == '{"verdict": "GO"}'
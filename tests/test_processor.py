@@ -0,0 +1,86 @@
+"""Тесты обработки пользовательского запроса (app/llm/processor.py)."""
+
+import asyncio
+
+import pytest
+
+from app import cache
+from app.llm import processor
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    cache.clear_all_caches()
+    yield
+    cache.clear_all_caches()
+
+
+def _fake_generic(output: str):
+    async def fake(**kwargs):
+        return output, {"tokens_total": 0}
+    return fake
+
+
+# ===== ФОЛБЭКИ ПАРСЕРА И КОМПРЕССОРА =====
+
+@pytest.mark.parametrize("output", ['["список"]', '"строка"', "не json"])
+def test_parse_user_request_falls_back_on_non_object(monkeypatch, output):
+    monkeypatch.setattr(processor, "ask_gigachat_generic", _fake_generic(output))
+
+    parsed = asyncio.run(processor.parse_user_request("Запустить сервис доставки", user_id="u"))
+
+    assert parsed.original_message == "Запустить сервис доставки"
+    assert parsed.intent == "other"
+    assert parsed.summary == "Запустить сервис доставки"
+
+
+@pytest.mark.parametrize("output", ['["список"]', "42", "не json", '{"intent": "idea"}'])
+def test_compress_user_message_falls_back_on_bad_output(monkeypatch, output):
+    monkeypatch.setattr(processor, "ask_gigachat_generic", _fake_generic(output))
+
+    compressed = asyncio.run(processor.compress_user_message("Запустить сервис доставки", user_id="u"))
+
+    assert compressed.intent == "other"
+    assert compressed.domain == "strategy"
+
+
+def test_compress_user_message_accepts_fenced_json(monkeypatch):
+    output = '```json\n{"intent": "idea", "domain": "product", "idea_summary": "доставка"}\n```'
+    monkeypatch.setattr(processor, "ask_gigachat_generic", _fake_generic(output))
+
+    compressed = asyncio.run(processor.compress_user_message("Запустить сервис доставки", user_id="u"))
+
+    assert compressed.intent == "idea"
+    assert compressed.idea_summary == "доставка"
+
+
+# ===== ИСТОРИЯ ДИАЛОГА =====
+
+def test_compress_history_empty():
+    assert processor.compress_history(None) == ""
+    assert processor.compress_history([]) == ""
+
+
+def test_compress_history_keeps_last_items():
+    history = ["первое", "второе", "третье"]
+
+    assert processor.compress_history(history, max_items=2) == "второе\nтретье"
+    assert processor.compress_history(history, max_items=5) == "первое\nвторое\nтретье"
+
+
+def test_compress_history_drops_oldest_over_char_budget():
+    history = ["a" * 10, "b" * 10, "c" * 10]
+
+    # Два последних сообщения + переносы строк = 22 символа
+    assert processor.compress_history(history, max_items=5, max_chars=22) == "b" * 10 + "\n" + "c" * 10
+    assert processor.compress_history(history, max_items=5, max_chars=21) == "c" * 10
+
+
+def test_compress_history_always_keeps_newest_message():
+    assert processor.compress_history(["старое", "x" * 100], max_chars=10) == "x" * 100
+
+
+def test_compress_history_default_budget():
+    history = ["x" * 3000, "y" * 3000]
+
+    assert processor.compress_history(history) == "y" * 3000
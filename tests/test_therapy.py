@@ -0,0 +1,138 @@
+"""Тесты /api/therapy: повтор запроса по Idempotency-Key и локальная дедупликация гипотез."""
+
+import itertools
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import cache
+from app.routes import therapy
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    cache.clear_all_caches()
+    yield
+    cache.clear_all_caches()
+
+
+@pytest.fixture
+def gigachat(monkeypatch):
+    """Терапевт отвечает пронумерованным вопросом, Генератор — без гипотез."""
+    calls = itertools.count()
+
+    async def fake_ask(agent, user_msg, **kwargs):
+        if agent == "therapy":
+            return orjson.dumps({"question": f"Вопрос {next(calls)}?"}).decode(), {}
+        return orjson.dumps({"updated_hypotheses": [], "new_hypotheses": []}).decode(), {}
+
+    monkeypatch.setattr(therapy, "ask_gigachat", fake_ask)
+
+
+@pytest.fixture
+def api(gigachat):
+    with TestClient(main.app) as test_client:
+        token = test_client.post("/api/login", json={"user_id": "therapy-user"}).json()["access_token"]
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        yield test_client
+
+
+def _say(api, message, session_id=None, idempotency_key=None):
+    headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+    resp = api.post("/api/therapy", json={"message": message, "session_id": session_id}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_same_answer_without_key_is_a_new_turn(api):
+    session_id = _say(api, "Не могу выбрать стратегию")["session_id"]
+
+    first = _say(api, "да", session_id)
+    second = _say(api, "да", session_id)
+
+    assert first["therapist_message"] != second["therapist_message"]
+
+
+def test_same_opening_line_without_key_starts_new_session(api):
+    first = _say(api, "Не могу выбрать стратегию")
+    second = _say(api, "Не могу выбрать стратегию")
+
+    assert first["session_id"] != second["session_id"]
+
+
+def test_retry_with_same_key_returns_previous_response(api):
+    first = _say(api, "Не могу выбрать стратегию", idempotency_key="retry-1")
+    second = _say(api, "Не могу выбрать стратегию", idempotency_key="retry-1")
+
+    assert second == first
+
+
+def test_same_key_with_different_message_is_not_a_retry(api):
+    session_id = _say(api, "Не могу выбрать стратегию")["session_id"]
+
+    first = _say(api, "да", session_id, idempotency_key="retry-2")
+    second = _say(api, "нет", session_id, idempotency_key="retry-2")
+
+    assert first["therapist_message"] != second["therapist_message"]
+
+
+# ===== ЛОКАЛЬНАЯ ДЕДУПЛИКАЦИЯ ГИПОТЕЗ =====
+
+def test_dedup_drops_reworded_duplicate_and_keeps_first():
+    updated = {"id": "h1", "hypothesis_text": "Страх провала мешает запуску продукта"}
+    reordered = {"hypothesis_text": "мешает запуску продукта страх  провала"}
+    different = {"hypothesis_text": "Команде не хватает компетенций в маркетинге"}
+
+    kept = therapy.dedup_hypotheses_locally([updated, reordered, different])
+
+    assert kept == [updated, different]
+
+
+def test_dedup_skips_empty_and_malformed_items():
+    valid = {"hypothesis_text": "Нет ясной цели"}
+
+    kept = therapy.dedup_hypotheses_locally([{"hypothesis_text": ""}, {}, "строка", None, valid])
+
+    assert kept == [valid]
+
+
+def test_dedup_keeps_distinct_hypotheses():
+    hypotheses = [
+        {"hypothesis_text": "Нет бюджета на запуск"},
+        {"hypothesis_text": "Руководитель боится конфликта с командой"},
+    ]
+
+    assert therapy.dedup_hypotheses_locally(hypotheses) == hypotheses
+
+
+def test_malformed_generator_lists_are_ignored(monkeypatch):
+    """null/объект вместо списка и не-объекты в списке не роняют ход."""
+    async def fake_ask(agent, user_msg, **kwargs):
+        if agent == "therapy":
+            return orjson.dumps({"question": "Что дальше?"}).decode(), {}
+        if agent == "therapy_hypothesis_generator":
+            return orjson.dumps({
+                "updated_hypotheses": None,
+                "new_hypotheses": {"hypothesis_text": "не список"},
+            }).decode(), {}
+        return orjson.dumps({"hypotheses": "не список"}).decode(), {}
+
+    monkeypatch.setattr(therapy, "ask_gigachat", fake_ask)
+
+    with TestClient(main.app) as test_client:
+        token = test_client.post("/api/login", json={"user_id": "therapy-user"}).json()["access_token"]
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        resp = test_client.post("/api/therapy", json={"message": "Не могу выбрать стратегию"})
+
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["therapist_message"] == "Что дальше?"
+
+
+def test_hypothesis_list_keeps_only_objects():
+    valid = {"hypothesis_text": "Нет ясной цели"}
+
+    assert therapy._hypothesis_list({"new_hypotheses": ["строка", None, valid]}, "new_hypotheses") == [valid]
+    assert therapy._hypothesis_list({"new_hypotheses": None}, "new_hypotheses") == []
+    assert therapy._hypothesis_list({}, "new_hypotheses") == []